@@ -85,12 +85,12 @@ with open("CBM_VBM.csv","w") as out:
                   GAPTYPE_slb_alpha = "INDIRECT"
                 if line.startswith(DIRGAP):
                   GAPTYPE_slb_alpha = "DIRECT"
-              if line.startswith(VBM) and alpha_counter==0:
-                alpha_counter += 1
-                VBM_alpha = float(line.split()[-2])
-              if line.startswith(VBM) and alpha_counter > 0 and VBM_alpha < float(line.split()[-2]):
-                alpha_counter += 1
-                VBM_alpha = float(line.split()[-2])
+              # keep the highest valence band top, splitting the line once
+              if line.startswith(VBM):
+                top = float(line.split()[-2])
+                if alpha_counter == 0 or VBM_alpha < top:
+                  alpha_counter += 1
+                  VBM_alpha = top
               VBM_alpha_eV = VBM_alpha*HeV
               CBM_alpha_eV = (VBM_alpha*HeV)+Ebg_slb_alpha
 
@@ -101,12 +101,12 @@ with open("CBM_VBM.csv","w") as out:
                   GAPTYPE_slb_beta = "INDIRECT"
                 if line.startswith(DIRGAP):
                   GAPTYPE_slb_beta = "DIRECT"
-              if line.startswith(VBM) and beta_counter==0:
-                beta_counter += 1
-                VBM_beta = float(line.split()[-2])
-              if line.startswith(VBM) and beta_counter > 0 and VBM_beta < float(line.split()[-2]):
-                beta_counter += 1
-                VBM_beta = float(line.split()[-2])
+              # keep the highest valence band top, splitting the line once
+              if line.startswith(VBM):
+                top = float(line.split()[-2])
+                if beta_counter == 0 or VBM_beta < top:
+                  beta_counter += 1
+                  VBM_beta = top
               VBM_beta_eV = VBM_beta*HeV
               CBM_beta_eV = (VBM_beta*HeV)+Ebg_slb_beta
 
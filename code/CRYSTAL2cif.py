@@ -5,14 +5,13 @@ This is a simple script to convert the final geometry of CRYSTAL09 output into c
 Usage: CRYSTAL2cif.py [CRYSTAL09 output] [cif file name]
 """
 import os, sys, math
-import re
 
 cryout = open(str(sys.argv[1]))
 cif  = open(str(sys.argv[2]),'w')
 
 for line in cryout:
   #if line.find(" PRIMITIVE CELL - ",0,20) == 0:
-  if re.match(r"^ PRIMITIVE CELL", line):
+  if line.startswith(" PRIMITIVE CELL"):
     cryout.next()
     [a,b,c,alpha,beta,gamma] = [float(i) for i in cryout.next().split()]
     cryout.next()
@@ -11,9 +11,9 @@ This script is meant to get all the shells from all atoms and separate the shell
 """Finds the shells in the output file and then sends them as a list to be organized"""
 def get_unclean_shells(output_lines):
   index_shells = 0
-  for line in output_lines:
+  for i, line in enumerate(output_lines):
     if "LOCAL ATOMIC FUNCTIONS BASIS SET" in line:
-      index_shells = output_lines.index(line)
+      index_shells = i
       break
   unclean_shells = []
   for index in range(index_shells + 4, len(output_lines)):
@@ -49,12 +49,11 @@ def shell_data(data_list):
 #Compiles all unique atoms in order to generate list for shells
   atom_list = []
   atoms_index = []
-  for line in data_list:
+  for atom_index, line in enumerate(data_list):
     if len(line) == 5:
       atoms.append(line[1])
       if line[1] not in atom_list:
         atom_and_index = []
-        atom_index = data_list.index(line)
         atom_list.append(line[1])
         atom_and_index.append(line[1])
         atom_and_index.append(atom_index)
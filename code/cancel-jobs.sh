@@ -9,8 +9,14 @@ minjobnum="$1"
 
 myself="$(id -u -n)"
 
+# Query the queue once and cancel every matching job with a single scancel
+jobs=""
 for j in $(squeue --user="$myself" --noheader --format='%i') ; do
   if [ "$j" -gt "$minjobnum" ] ; then
-    scancel "$j"
+    jobs="$jobs $j"
   fi
 done
+
+if [ -n "$jobs" ] ; then
+  scancel $jobs
+fi
@@ -7,9 +7,8 @@ Created on Mon Oct 17 14:17:47 2022
 """
 
 
+import concurrent.futures
 import glob
-import matplotlib
-matplotlib.use('tkagg') # <-- THIS MAKES IT FAST!
 import os
 
 HeV    = 27.2114
@@ -31,17 +30,17 @@ def get_bands(output_content):
   beta_val_band = []
   
   #check which keyword applies
-  for line in output_content:
+  for i, line in enumerate(output_content):
     if "ALPHA      ELECTRONS" in line:
-      index_alpha = output_content.index(line)
+      index_alpha = i
     if "BETA       ELECTRONS" in line:
-      index_beta = output_content.index(line)
+      index_beta = i
     if line.startswith(" DIRECT ENERGY BAND GAP"):
-      index_direct = output_content.index(line)
+      index_direct = i
     if "POSSIBLY CONDUCTING STATE" in line:
-      index_cond = output_content.index(line)
+      index_cond = i
     if "INDIRECT ENERGY BAND GAP" in line:
-      index_indirect = output_content.index(line)
+      index_indirect = i
   print('alpha line #:' + str(index_alpha))
   print('beta line #:' + str(index_beta))
   print('direct line #:' + str(index_direct))
@@ -140,6 +139,13 @@ def get_bands(output_content):
 
 #################################################################################
 
+# tells the kernel the .out file is read once front to back so it reads ahead
+def advise_sequential(f):
+  if hasattr(os, "posix_fadvise"):
+    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+#################################################################################
+
 # writes the Electronic Transport D3 for PProperty 
 def write_d3(d3_file, val, cond, newk):
     
@@ -171,13 +177,14 @@ pathlist = glob.glob(DIR+'*.out')
 nDIR = len(DIR)
 ntype = len(".out")
 
-for path in pathlist:
+def process_one(path):
     path_in_str = str(path)
     material = path_in_str[nDIR:-ntype]
-    if material == "":break
+    if material == "":return
     output_content = []
     
     with open(path, 'r') as f:
+       advise_sequential(f)
        for line in f:
           if "SCF ENDED" in line:
              break
@@ -213,4 +220,8 @@ for path in pathlist:
     os.popen(f"cp {f9_file_name} {new_f9}")
     d3_file_name = pathname + material + "_TRANSPORT.d3"
     with open(d3_file_name, 'w+') as d3_file:
-      write_d3(d3_file, val, cond, newk)
\ No newline at end of file
+      write_d3(d3_file, val, cond, newk)
+
+if __name__ == "__main__":
+    with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        list(ex.map(process_one, pathlist))
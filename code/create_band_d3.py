@@ -1,12 +1,22 @@
 #!/usr/bin/env python3
-import os, sys, math
-import re
-import linecache
-import shutil
-import itertools
+import os
+import functools
+import concurrent.futures
 #This directory is where the d3_input folder is saved
 dir='/mnt/home/djokicma/bin'
 
+#Tells the kernel the .out file is read once front to back so it reads ahead
+def advise_sequential(f):
+  if hasattr(os, "posix_fadvise"):
+    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+#Lines of a k-path template in d3_input; the same few templates are used for
+#every material, so each one is read only once per process
+@functools.lru_cache(maxsize=None)
+def kpath_lines(name):
+  with open(dir+'/d3_input/'+name, 'r') as dat_file:
+    return tuple(dat_file.readlines())
+
 def sym(input_lines, output_lines):
   if input_lines[1] == 'CRYSTAL':
     sym_num = int(input_lines[3])
@@ -65,68 +75,50 @@ def writed3(sym_num, sym_name, orbital_num, d3_file, output_name):
 #L G
   if sym_num <= 2:
     #d3_file.write("9 16 1000 1 " + str(orbital_num) + " 1 0\n")
-    dat_file = open(dir+'/d3_input/Triclinic-Explicit.d3', 'r+')
-    for line in dat_file.readlines():
-        d3_lines.append(line)
+    d3_lines = kpath_lines('Triclinic-Explicit.d3')
     d3_file.write(str(len(d3_lines)-1) + " 2 1000 1 " + str(orbital_num) + " 1 0\n")
     for line in d3_lines:
         d3_file.write(line)
   elif sym_num >= 3 and sym_num < 16:
     if sym_name == "P":
-      dat_file = open(dir+'/d3_input/Monoclinic_Simple.d3', 'r+')
-      for line in dat_file.readlines():
-        d3_lines.append(line)
+      d3_lines = kpath_lines('Monoclinic_Simple.d3')
       d3_file.write(str(len(d3_lines)-1) + " 0 1000 1 " + str(orbital_num) + " 1 0\n")
       for line in d3_lines:
         d3_file.write(line)
     if sym_name == "C":
-      dat_file = open(dir+'/d3_input/Monoclinic_AC.d3', 'r+')
-      for line in dat_file.readlines():
-        d3_lines.append(line)
+      d3_lines = kpath_lines('Monoclinic_AC.d3')
       d3_file.write(str(len(d3_lines)-1) + " 0 1000 1 " + str(orbital_num) + " 1 0\n")
       for line in d3_lines:
         d3_file.write(line)
   elif sym_num >= 16 and sym_num < 75:
     if sym_name == "P":
-      dat_file = open(dir+'/d3_input/Orthorombic_Simple.d3', 'r+')
-      for line in dat_file.readlines():
-        d3_lines.append(line)
+      d3_lines = kpath_lines('Orthorombic_Simple.d3')
       d3_file.write(str(len(d3_lines)-1) + " 0 1000 1 " + str(orbital_num) + " 1 0\n")
       for line in d3_lines:
         d3_file.write(line)
     if sym_name == "C":
-      dat_file = open(dir+'/d3_input/Orthorombic_AB.d3', 'r+')
-      for line in dat_file.readlines():
-        d3_lines.append(line)
+      d3_lines = kpath_lines('Orthorombic_AB.d3')
       d3_file.write(str(len(d3_lines)-1) + " 0 1000 1 " + str(orbital_num) + " 1 0\n")
       for line in d3_lines:
         d3_file.write(line)
     if sym_name == "F":
-      dat_file = open(dir+'/d3_input/Orthorombic_FC.d3', 'r+')
-      for line in dat_file.readlines():
-        d3_lines.append(line)
+      d3_lines = kpath_lines('Orthorombic_FC.d3')
       d3_file.write(str(len(d3_lines)-1) + " 0 1000 1 " + str(orbital_num) + " 1 0\n")
       for line in d3_lines:
         d3_file.write(line)
     if sym_name == "I":
-      dat_file = open(dir+'/d3_input/Orthorombic_BC.d3', 'r+')
-      for line in dat_file.readlines():
-        d3_lines.append(line)
+      d3_lines = kpath_lines('Orthorombic_BC.d3')
       d3_file.write(str(len(d3_lines)-1) + " 0 1000 1 " + str(orbital_num) + " 1 0\n")
       for line in d3_lines:
         d3_file.write(line)
     if sym_name == "A":
-      dat_file = open(dir+'/d3_input/Orthorombic_AB.d3', 'r+')
-      for line in dat_file.readlines():
-        d3_lines.append(line)
+      d3_lines = kpath_lines('Orthorombic_AB.d3')
       d3_file.write(str(len(d3_lines)-1) + " 0 1000 1 " + str(orbital_num) + " 1 0\n")
       for line in d3_lines:
         d3_file.write(line)
   elif sym_num >= 75  and sym_num < 143:
     if sym_name == "I":
-      dat_file = open(dir+'/d3_input/Tetragonal_BC.d3', 'r+')
-      for line in dat_file.readlines():
-        d3_lines.append(line)
+      d3_lines = kpath_lines('Tetragonal_BC.d3')
       d3_file.write(str(len(d3_lines)-1) + " 0 1000 1 " + str(orbital_num) + " 1 0\n")
       for line in d3_lines:
         d3_file.write(line)
@@ -137,53 +129,39 @@ def writed3(sym_num, sym_name, orbital_num, d3_file, output_name):
 #      d3_file.write("0 0 8   0 0 0\n")
 #      d3_file.write("END")
     if sym_name == "P":
-      dat_file = open(dir+'/d3_input/Tetragonal_Simple.d3', 'r+')
-      for line in dat_file.readlines():
-        d3_lines.append(line)
+      d3_lines = kpath_lines('Tetragonal_Simple.d3')
       d3_file.write(str(len(d3_lines)-1) + " 0 1000 1 " + str(orbital_num) + " 1 0\n")
       for line in d3_lines:
         d3_file.write(line)
   elif sym_num >= 143 and sym_num < 168:
     if sym_name == "P":
-      dat_file = open(dir+'/d3_input/Hexagonal.d3', 'r+')
-      for line in dat_file.readlines():
-        d3_lines.append(line)
+      d3_lines = kpath_lines('Hexagonal.d3')
       d3_file.write(str(len(d3_lines)-1) + " 0 1000 1 " + str(orbital_num) + " 1 0\n")
       for line in d3_lines:
         d3_file.write(line)
     if sym_name == "R":
-      dat_file = open(dir+'/d3_input/Rhombohedral.d3', 'r+')
-      for line in dat_file.readlines():
-        d3_lines.append(line)
+      d3_lines = kpath_lines('Rhombohedral.d3')
       d3_file.write(str(len(d3_lines)-1) + " 0 1000 1 " + str(orbital_num) + " 1 0\n")
       for line in d3_lines:
         d3_file.write(line)
   elif sym_num >= 168 and sym_num < 195:
-    dat_file = open(dir+'/d3_input/Hexagonal.d3', 'r+')
-    for line in dat_file.readlines():
-      d3_lines.append(line)
+    d3_lines = kpath_lines('Hexagonal.d3')
     d3_file.write(str(len(d3_lines)-1) + " 0 1000 1 " + str(orbital_num) + " 1 0\n")
     for line in d3_lines:
       d3_file.write(line)
   elif sym_num >= 195:
     if sym_name == "P":
-      dat_file = open(dir+'/d3_input/Cubic_Simple.d3', 'r+')
-      for line in dat_file.readlines():
-        d3_lines.append(line)
+      d3_lines = kpath_lines('Cubic_Simple.d3')
       d3_file.write(str(len(d3_lines)-1) + " 0 1000 1 " + str(orbital_num) + " 1 0\n")
       for line in d3_lines:
         d3_file.write(line)
     if sym_name == "F":
-      dat_file = open(dir+'/d3_input/Cubic_FC.d3', 'r+')
-      for line in dat_file.readlines():
-        d3_lines.append(line)
+      d3_lines = kpath_lines('Cubic_FC.d3')
       d3_file.write(str(len(d3_lines)-1) + " 0 1000 1 " + str(orbital_num) + " 1 0\n")
       for line in d3_lines:
         d3_file.write(line)
     if sym_name == "I":
-      dat_file = open(dir+'/d3_input/Cubic_BC.d3', 'r+')
-      for line in dat_file.readlines():
-        d3_lines.append(line)
+      d3_lines = kpath_lines('Cubic_BC.d3')
       d3_file.write(str(len(d3_lines)-1) + " 0 1000 1 " + str(orbital_num) + " 1 0\n")
       for line in d3_lines:
         d3_file.write(line)
@@ -193,34 +171,27 @@ data_folder = os.getcwd()
 #data_folder = r'/mnt/home/maldo103/2DHUB_2021/MX-MX2_Calchogenides/Cu2Te_BANDS'
 data_files = os.listdir(data_folder)
 
-"""Reads each file given by data_folder and loops through to create d3"""
-for file_name in data_files:
+"""Reads each file given by data_folder and creates its d3"""
+def process_one(file_name):
   if ".d12" in file_name:
     input_file_name = os.path.join(data_folder, file_name)
-    input_file = open(input_file_name, 'r+')
-    input_lines = []
-    for line in input_file.readlines():
-      if '\n' in line:
-       clean_line = line.replace('\n','')
-       input_lines.append(clean_line)
-      else:
-       input_lines.append(line)
+    with open(input_file_name, 'r') as input_file:
+      input_lines = input_file.read().splitlines()
     output_name = file_name.replace(".d12",".out")
     output_file_name = os.path.join(data_folder,output_name)
-    output_file = open(output_file_name, 'r+')
-    output_lines = []
-    for line in output_file.readlines():
-      if '\n' in line:
-       clean_line = line.replace('\n','')
-       output_lines.append(clean_line)
-      else:
-       output_lines.append(line)
+    with open(output_file_name, 'r') as output_file:
+      advise_sequential(output_file)
+      output_lines = output_file.read().splitlines()
     d3_name = file_name.replace(".d12","_BAND.d3")
     d3_file_name = os.path.join(data_folder,d3_name)
-    d3_file = open(d3_file_name, 'w+')
     f9_old = file_name.replace(".d12",".f9")
     f9_new = file_name.replace(".d12","_BAND.f9")
     os.system("mv " + data_folder +"/" + f9_old + " " + data_folder + "/" + f9_new)
     sym_num, sym_name, orbital_num = sym(input_lines, output_lines)
-    writed3(sym_num, sym_name, orbital_num, d3_file,output_name)
+    with open(d3_file_name, 'w+') as d3_file:
+      writed3(sym_num, sym_name, orbital_num, d3_file,output_name)
     #os.system("rm " + data_folder +"/" + file_name + " " + data_folder + "/" + output_name)
+
+if __name__ == "__main__":
+  with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+    list(ex.map(process_one, data_files))
@@ -2,25 +2,49 @@ import ase.io
 import numpy as np
 import math as m
 import glob
+import os
+import concurrent.futures
+from itertools import repeat
+from functools import lru_cache
+from pathlib import Path
 
+ECPs = np.array([37,38,39,40,41,42], dtype=np.int64) #full.basis
+
+ATOM_LINE = "%-3d %-8.6f  %-8.6f  %-9.6f  Biso    1.000000    %s \n"
+
+KS = np.array([2,3,5,6,10,15,30])
+
+# Optimization block for each calculation type
+OPT_BLOCKS = {
+    "SP":      "END",
+    "OPT":     "OPT\nCVOLOPT\nMAXCYCLE\n800\nENDOPT\nEND",
+    "OPTGEOM": "OPTGEOM\nFULLOPTG\nMAXCYCLE\n800\nENDOPT\nEND",
+}
+
+# Hamiltonian and SCF block; filled with nShrink, the k-points and FM mixing
+BULK_TAIL = "99 0\nEND\nDFT\nSPIN\nHSE06-D3\nXLGRID\nEND\nTOLINTEG\n9 9 9 9 18\nTOLDEE\n7\nSHRINK\n0 %d\n %d %d %d\nSCFDIR\nBIPOSIZE\n110000000\nEXCHSIZE\n110000000\nMAXCYCLE\n800\nFMIXING\n%d\nDIIS\nPPAN\nEND"
+SLAB_TAIL = "99 0\nEND\nDFT\nSPIN\nHSE06-D3\nXLGRID\nEND\nTOLINTEG\n9 9 9 9 18\nTOLDEE\n7\nSHRINK\n0 %d\n %d %d 1\nSCFDIR\nBIPOSIZE\n110000000\nEXCHSIZE\n110000000\nMAXCYCLE\n800\nFMIXING\n%d\nDIIS\nPPAN\nEND"
+
+BASIS_DIRS = {
+    "DZ": "/mnt/research/mendozacortes_group/bin/helpscripts/code/full.basis.doublezeta/", #Change This Directory to Double Zeta Basis Set Directory
+    "TZ": "/mnt/research/mendozacortes_group/bin/helpscripts/code/full.basis.triplezeta/", #Change This Directory to Triple Zeta Basis Set Directory
+}
+
+# Each basis set file is read from disk once and reused for every CIF
+@lru_cache(maxsize=None)
 def basis(num, basisset):
-    if basisset == "DZ":
-        dir_bas = "/mnt/research/mendozacortes_group/bin/helpscripts/code/full.basis.doublezeta/" #Change This Directory to Double Zeta Basis Set Directory
-    elif basisset == "TZ":
-        dir_bas = "/mnt/research/mendozacortes_group/bin/helpscripts/code/full.basis.triplezeta/" #Change This Directory to Triple Zeta Basis Set Directory
-    else: print("ERROR Improper Basis Set")
-    f       = open(dir_bas+str(num))
-    bs      = f.read() 
-    f.close()
-    return(bs)
-
-def unique(list):
-    x = []
-    for a in list:
-        if a not in x:
-            x.append(a)
-    x.sort()
-    return(x)
+    if basisset not in BASIS_DIRS:
+        print("ERROR Improper Basis Set")
+    dir_bas = BASIS_DIRS[basisset]
+    return(Path(dir_bas, str(num)).read_text())
+
+def unique(lst):
+    return(sorted(set(lst)))
+
+# Smallest k in KS with 40 < k*x < 75, or 1 if none fits
+def pick_k(x):
+    mask = (KS*x > 40.) & (KS*x < 75.)
+    return(int(KS[mask][0]) if mask.any() else 1)
 
 def CIF2D12(material,struc,path,opt,basisset):
     mat  = ase.io.read(path+material, format='cif')
@@ -45,7 +69,7 @@ def CIF2D12(material,struc,path,opt,basisset):
         #GET ATOM POSTIONS
         frac = mat.get_scaled_positions()
         cart = mat.get_positions()
-        an   = mat.get_atomic_numbers()
+        an   = np.asarray(mat.get_atomic_numbers(), dtype=np.int64)
         name = mat.get_chemical_symbols()
     
         ATOMS = len(an)
@@ -65,29 +89,17 @@ def CIF2D12(material,struc,path,opt,basisset):
             print("%-8.6f   %-8.6f  %-8.6f  %-6.4f  %-6.4f  %-6.4f"%(a,b,c,alpha,beta,gamma),file=f)
             print(str(ATOMS),file=f)
 
-        ECPs    = [37,38,39,40,41,42] #full.basis        
-        for i in range(0,ATOMS):
-            if (an[i] in ECPs) or (an[i] > 43):
-                # Use ELECTRON CORE POTENTIALS 
-                an[i] += 200
-            hi  = frac[i][0]
-            ki  = frac[i][1]
-            li  = frac[i][2]
-            zi  = cart[i][2]
-            if struc == "BULK":
-                print("%-3d %-8.6f  %-8.6f  %-9.6f  Biso    1.000000    %s "%(an[i],hi,ki,li,name[i]),file=f)
-            if struc == "SLAB":
-                if zi>2.*c: zi = zi - 3.*c
-                print("%-3d %-8.6f  %-8.6f  %-9.6f  Biso    1.000000    %s "%(an[i],hi,ki,zi,name[i]),file=f)
-
-        if opt   == "SP":
-            OPT  = "END"
-        elif opt   == "OPT":	
-            OPT  = "OPT\nCVOLOPT\nMAXCYCLE\n800\nENDOPT\nEND"
-        elif opt == "OPTGEOM":
-            OPT  = "OPTGEOM\nFULLOPTG\nMAXCYCLE\n800\nENDOPT\nEND"
-            
-        print(OPT,file=f)
+        # Use ELECTRON CORE POTENTIALS
+        an = np.where(np.isin(an, ECPs) | (an > 43), an + 200, an)
+        # BULK uses fractional z, SLAB uses cartesian z folded back into the cell
+        if struc == "BULK":
+            zi = frac[:,2]
+        if struc == "SLAB":
+            zi = np.where(cart[:,2] > 2.*c, cart[:,2] - 3.*c, cart[:,2])
+        if struc == "BULK" or struc == "SLAB":
+            f.write("".join(ATOM_LINE%row for row in zip(an,frac[:,0],frac[:,1],zi,name)))
+
+        print(OPT_BLOCKS[opt],file=f)
         #WRITE INPUT DECK
         ## BASIS SETS
         ### DETERMINE UNIQUE ELEMENTS
@@ -100,25 +112,20 @@ def CIF2D12(material,struc,path,opt,basisset):
                 print(basis(i,basisset),end='',file=f)
             else: print("ERROR Improper Structure type input")
             
-        ks      = [2,3,5,6,10,15,30]
         FM      = 80 # FM Mixing
 
-        ka = kb = kc =1
-        for k in ks:
-            if k*a > 40. and k*a<75. and ka ==1: ka = k
-            if k*b > 40. and k*b<75. and kb ==1: kb = k
-            if k*c > 40. and k*c<75. and kc ==1: kc = k
-            if sg_bk != 1:
-                ka = kb = kc = 20
+        ka, kb, kc = pick_k(a), pick_k(b), pick_k(c)
+        if sg_bk != 1:
+            ka = kb = kc = 20
         
                 
         if ka ==0 or kb == 0 or kc == 0: print("ERROR:",ka,kb,kc)
         k_max = max([ka,kb,kc])
         nShrink = k_max*2
         if struc == "BULK":
-            TAIL    = "99 0\nEND\nDFT\nSPIN\nHSE06-D3\nXLGRID\nEND\nTOLINTEG\n9 9 9 9 18\nTOLDEE\n7\nSHRINK\n0 %d\n %d %d %d\nSCFDIR\nBIPOSIZE\n110000000\nEXCHSIZE\n110000000\nMAXCYCLE\n800\nFMIXING\n%d\nDIIS\nPPAN\nEND"%(nShrink,ka,kb,kc,FM)    
+            TAIL    = BULK_TAIL%(nShrink,ka,kb,kc,FM)
         if struc == "SLAB":    
-            TAIL    = "99 0\nEND\nDFT\nSPIN\nHSE06-D3\nXLGRID\nEND\nTOLINTEG\n9 9 9 9 18\nTOLDEE\n7\nSHRINK\n0 %d\n %d %d 1\nSCFDIR\nBIPOSIZE\n110000000\nEXCHSIZE\n110000000\nMAXCYCLE\n800\nFMIXING\n%d\nDIIS\nPPAN\nEND"%(nShrink,ka,kb,FM)    
+            TAIL    = SLAB_TAIL%(nShrink,ka,kb,FM)
         print(TAIL,file=f)
     return
 DIR     = "/mnt/home/djokicma/Crystal17/IRCOF102/COF_CIF/Simple/" # Change This Directory to CIF Directory
@@ -126,46 +133,50 @@ pathlist = glob.glob(DIR+'*.cif')
 nDIR     = len(DIR)
 ntype    = len(".cif")
 
-while True:
-    try:
-        options1 = int(input(' Enter 0 for Single Point Energy, Enter 1 for OPT cVol, or Enter 2 for OPTGEOM: \n'))
-        options2 = int(input('Enter 3 for SLAB or Enter 4 for BULK: \n'))
-        options3 = int(input('Enter 5 for Double Zeta Basis Set or Enter 6 for Triple Zeta Basis Set: \n'))
-        break
+if __name__ == "__main__":
+    while True:
+        try:
+            options1 = int(input(' Enter 0 for Single Point Energy, Enter 1 for OPT cVol, or Enter 2 for OPTGEOM: \n'))
+            options2 = int(input('Enter 3 for SLAB or Enter 4 for BULK: \n'))
+            options3 = int(input('Enter 5 for Double Zeta Basis Set or Enter 6 for Triple Zeta Basis Set: \n'))
+            break
     
-    except ValueError:
-        print('Invalid Input. Try again.')
-
-material = ""
-for path in pathlist:
-    # because path is object not string
-    option1 = options1
-    option2 = options2
-    option3 = options3
-    path_in_str = str(path)
-    material = path_in_str[nDIR:]
-    if material   == "":break
-    if option1 == 0: 
-        option1  = "SP"
-    elif option1 == 1:
-        option1  = "OPT"
-    elif option1 == 2: 
-        option1  = "OPTGEOM"
-    else: 
-        print('Invalid Input for Option 1. Try again.')
-        break
-    if option2 == 3:
-        option2  = "SLAB"
-    elif option2 == 4:
-        option2  = "BULK"
-    else: 
-        print('Invalid Input for Option 2. Try again.')
-        break
-    if option3 == 5:
-        option3  = "DZ"
-    elif option3 == 6:
-        option3  = "TZ"
-    else: 
-        print('Invalid Input for Option 3. Try again.')
-        break
-    CIF2D12(material,option2,DIR,option1,option3)
+        except ValueError:
+            print('Invalid Input. Try again.')
+
+    materials = []
+    for path in pathlist:
+        # because path is object not string
+        option1 = options1
+        option2 = options2
+        option3 = options3
+        path_in_str = str(path)
+        material = path_in_str[nDIR:]
+        if material   == "":break
+        if option1 == 0: 
+            option1  = "SP"
+        elif option1 == 1:
+            option1  = "OPT"
+        elif option1 == 2: 
+            option1  = "OPTGEOM"
+        else: 
+            print('Invalid Input for Option 1. Try again.')
+            break
+        if option2 == 3:
+            option2  = "SLAB"
+        elif option2 == 4:
+            option2  = "BULK"
+        else: 
+            print('Invalid Input for Option 2. Try again.')
+            break
+        if option3 == 5:
+            option3  = "DZ"
+        elif option3 == 6:
+            option3  = "TZ"
+        else: 
+            print('Invalid Input for Option 3. Try again.')
+            break
+        materials.append(material)
+    if materials:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+            list(ex.map(CIF2D12, materials, repeat(option2), repeat(DIR), repeat(option1), repeat(option3)))
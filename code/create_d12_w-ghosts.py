@@ -1,12 +1,7 @@
-from pathlib import Path
-import warnings
 import numpy as np
 import glob
+import concurrent.futures
 import math
-import matplotlib
-matplotlib.use('tkagg') # <-- THIS MAKES IT FAST!
-import matplotlib.pyplot as plt
-import csv
 import os
 
 
@@ -18,83 +13,85 @@ LAT = ' LATTICE PARAMETERS  (ANGSTROMS AND DEGREES) - PRIMITIVE CELL'
 CART   = " CARTESIAN COORDINATES - PRIMITIVE CELL"
 #################################################################################
 
-for path in pathlist:
+# tells the kernel the .out file is read once front to back so it reads ahead
+def advise_sequential(f):
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+#################################################################################
+
+#:::::::::::::::   BULK ANALYSIS   ::::::::::::::::::::::
+# returns the interlayer spacing of the bulk, read from the bulk .out file
+def bulk_spacing(filename):
+    with open(filename,'r') as blk:
+        advise_sequential(blk)
+        el = np.zeros(99)
+        x  = np.zeros(99)
+        y  = np.zeros(99)
+        z  = np.zeros(99)
+        z_c  = np.zeros(99)
+        z_new = np.zeros(99)
+
+        id  = 9999
+        md  = 9999
+        g = 9999
+        atoms    = 99
+        for i, line in enumerate(blk):
+          # GET CARTESIAN POSTIONS FOR ATOMS
+          if line.startswith(" NUMBER OF IRREDUCIBLE"):
+            atoms = int(line.split()[-1])
+          if line.startswith(" CARTESIAN COORDINATES - PRIMITIVE CELL"):
+              md = i
+          if " PROCESS" in line:
+            md+=1
+            continue
+          if md+4 <= i and i <= md+atoms+3:
+             data = line.split()
+             el[i-md-4] = float(data[-5])
+             if el[i-md-4] >200:el[i-md-11] -=200
+             x[i-md-4] = float(data[-3])
+             y[i-md-4] = float(data[-2])
+             z[i-md-4] = float(data[-1])
+          # GET THE INFORMATION ON THE PRIMITIVE CELL (ANG. and DEG.)
+          if LAT in line:
+            id = i
+          if i == id+2:
+            # FIND THE OPTIMIZED PRIMITIVE CELL
+            cell    = line.split()
+            C     = float(cell[2])
+            ang_alpha = math.radians(float(cell[3]))
+            ang_beta = math.radians(float(cell[4]))
+            ang_gamma = math.radians(float(cell[5]))
+          if line.startswith(" ATOMS IN THE ASYMMETRIC UNIT"):
+            g = i
+          if i>=g+3 and i<=g+3+atoms-1:
+            z_c[i-g-3] = float(line.split()[6])
+            if z[i-g-3] < 0.:
+                z_new[i-g-3] = z[i-g-3] + 1.0
+            else:
+                z_new[i-g-3] = z[i-g-3]
+    #interlayer spacings:
+    cos_a, cos_b, cos_g = math.cos(ang_alpha), math.cos(ang_beta), math.cos(ang_gamma)
+    height = (C/math.sin(ang_gamma))*math.sqrt(1-cos_a**2-cos_b**2-cos_g**2+2*cos_a*cos_b*cos_g)
+    if (1+min(z_c)-max(z_c)) > 0.001:
+        space = ((1+min(z_c))-max(z_c))*height
+    elif (1+min(z_c)-max(z_c)) < 0.001:
+        space = ((1-max(z_new)+min(z_new)))*height
+    return space
+
+#################################################################################
+
+def process_one(path):
     path_in_str = str(path)
     material = path_in_str[nDIR:-ntype]
-    if material == "":break
+    if material == "":return
     #print(material)
     SLAB     = material+"_slab.out"
     BULK     = material+"_bulk.out"
     SLABd12  = material+"_slab.d12"
     new_SLABd12 = material+"_ghostatoms_slab.d12"
     if os.path.exists(DIR+SLAB) and os.path.exists(DIR+BULK):
-        #:::::::::::::::   BULK ANALYSIS   ::::::::::::::::::::::
-        with open(DIR+BULK,'r') as blk:
-            el = np.zeros(99)
-            x  = np.zeros(99)
-            y  = np.zeros(99)
-            z  = np.zeros(99)
-            z_c  = np.zeros(99)
-            z_new = np.zeros(99)
-
-            id  = 9999
-            md  = 9999
-            g = 9999
-            atoms    = 99
-            d      = 0.
-            k      = 0
-            switch   = 0
-            E_blk    = 999999
-            IAD_blk  = 999999
-            state_blk    = "Null"
-            Ebg_blk    = 9999999
-            GAPTYPE_blk  = "Null"
-            for i, line in enumerate(blk):
-              # GET CARTESIAN POSTIONS FOR ATOMS
-              if line.startswith(" NUMBER OF IRREDUCIBLE"):
-                atoms = int(line.split()[-1])
-              if line.startswith(" CARTESIAN COORDINATES - PRIMITIVE CELL"):
-                  md = i
-              if " PROCESS" in line:
-                md+=1
-                continue
-              if md+4 <= i and i <= md+atoms+3:
-                 el[i-md-4] = float(line.split()[-5])
-                 if el[i-md-4] >200:el[i-md-11] -=200
-                 x[i-md-4] = float(line.split()[-3])
-                 y[i-md-4] = float(line.split()[-2])
-                 z[i-md-4] = float(line.split()[-1])
-              # GET THE INFORMATION ON THE PRIMITIVE CELL (ANG. and DEG.)
-              if LAT in line:
-                id = i
-              if i == id+2:
-                # FIND THE OPTIMIZED PRIMITIVE CELL
-                cell    = line.split()
-                A     = float(cell[0])
-                B     = float(cell[1])
-                C     = float(cell[2])
-                alpha   = float(cell[3])
-                beta    = float(cell[4])
-                gamma   = float(cell[5])
-                V     = float(cell[6])
-                ang_alpha = math.radians(alpha)
-                ang_beta = math.radians(beta)
-                ang_gamma = math.radians(gamma)
-              if line.startswith(" ATOMS IN THE ASYMMETRIC UNIT"):
-                g = i
-              if i>=g+3 and i<=g+3+atoms-1:
-                z_c[i-g-3] = float(line.split()[6])
-                if z[i-g-3] < 0.:
-                    z_new[i-g-3] = z[i-g-3] + 1.0
-                else:
-                    z_new[i-g-3] = z[i-g-3]
-        #interlayer spacings:
-        if (1+min(z_c)-max(z_c)) > 0.001:
-            space = ((1+min(z_c))-max(z_c))*(C/math.sin(ang_gamma))*math.sqrt(1-math.cos(ang_alpha)**2-math.cos(ang_beta)**2-math.cos(ang_gamma)**2+2*math.cos(ang_alpha)*math.cos(ang_beta)*math.cos(ang_gamma))
-        elif (1+min(z_c)-max(z_c)) < 0.001:
-            space = ((1-max(z_new)+min(z_new)))*(C/math.sin(ang_gamma))*math.sqrt(1-math.cos(ang_alpha)**2-math.cos(ang_beta)**2-math.cos(ang_gamma)**2+2*math.cos(ang_alpha)*math.cos(ang_beta)*math.cos(ang_gamma))
-
-        blk.close()
+        space = bulk_spacing(DIR+BULK)
     lines_in_d12 = []
     end_index = []
     counter = 999999999
@@ -123,15 +120,14 @@ for path in pathlist:
 
     # z_high and z_low designate where we will put the atoms in the z-direction
     # I'm using the interlayer bulk distance (called "space" in this script) as the separation distance
-    z_high = [x+(max(z)-min(z))+space for x in z]
-    z_low = [x-(max(z)-min(z))-space for x in z]
+    delta = np.ptp(z) + space
+    z_high = z + delta
+    z_low = z - delta
 
     # We initiate a bunch of variables
-    el_ghosts = [*el,*el]
-    el_ghosts = [int(x) for x in el_ghosts]
-    x_ghosts = [*x,*x]
-    y_ghosts = [*y,*y]
-    z_ghosts = [*z_high,*z_low]
+    x_ghosts = np.concatenate([x,x])
+    y_ghosts = np.concatenate([y,y])
+    z_ghosts = np.concatenate([z_high,z_low])
     atom_index = []
 
     # Append the ghost atom indexing into "atom_idx"
@@ -142,45 +138,33 @@ for path in pathlist:
     atom_idx = ' '.join(atom_index)
     atom_idx = atom_idx + '\n'
 
-    # Insert keywords in the geomtry input block.
-    # We are keeping track of lines with idx and idx_ghostatoms.
-    lines_in_d12.insert(idx,'FRACTION\n')
-    idx += 1
-    idx_ghostatoms += 1
-    lines_in_d12.insert(idx,'ATOMINSE\n')
-    idx += 1
-    idx_ghostatoms += 1
-    lines_in_d12.insert(idx,str(num_atoms*2)+'\n')
-    idx += 1
-    idx_ghostatoms += 1
-    # Insert new atoms in the geometry input block
+    # Build the blocks that go into the d12 and splice them in once,
+    # rather than shifting the whole list on every insert.
+    # Keywords and new atoms go in the geometry input block, before the first "END".
     # We use the same basis set for all of the new atoms
     # We will arbitrarily number these atoms "101"
-    for i in range(len(x_ghosts)):
-        lines_in_d12.insert(idx+i,str(101)+' '+str(x_ghosts[i])+' '+str(y_ghosts[i])+' '+str(z_ghosts[i])+'\n')
-        idx_ghostatoms +=1
-
-    # Insert the basis set for ghosts (101)
-    lines_in_d12.insert(idx_ghostatoms-1,'101 1\n')
-    idx_ghostatoms += 1
-    lines_in_d12.insert(idx_ghostatoms-1,'0  1  1  0.0  1.0\n')
-    idx_ghostatoms += 1
-    lines_in_d12.insert(idx_ghostatoms-1,'       0.150    1.0       1.0\n')
-    idx_ghostatoms += 1
-
-    #Make new inserted atoms into ghosts
-    lines_in_d12.insert(idx_ghostatoms,'GHOSTS\n')
-    idx_ghostatoms += 1
-    lines_in_d12.insert(idx_ghostatoms,str(num_atoms*2)+ '\n') #We are using num_atoms*2 because we are putting a ghost layer above and below
-    idx_ghostatoms += 1
-    lines_in_d12.insert(idx_ghostatoms,atom_idx)
+    geom_block = ['FRACTION\n','ATOMINSE\n',str(num_atoms*2)+'\n']
+    geom_block += [str(101)+' '+str(x_ghosts[i])+' '+str(y_ghosts[i])+' '+str(z_ghosts[i])+'\n' for i in range(len(x_ghosts))]
+
+    # The basis set for ghosts (101) goes right before "99 0"
+    basis_block = ['101 1\n','0  1  1  0.0  1.0\n','       0.150    1.0       1.0\n']
+
+    # Make new inserted atoms into ghosts, right after "99 0"
+    # We are using num_atoms*2 because we are putting a ghost layer above and below
+    ghost_block = ['GHOSTS\n',str(num_atoms*2)+'\n',atom_idx]
+
+    idx_99 = idx_ghostatoms - 1
+    lines_in_d12 = (lines_in_d12[:idx] + geom_block + lines_in_d12[idx:idx_99] + basis_block
+                    + lines_in_d12[idx_99:idx_ghostatoms] + ghost_block + lines_in_d12[idx_ghostatoms:])
     #print(lines_in_d12)
     if space > 3:
         print('Warning! The material ' + str(material) + ' has a LARGE ghost atom spacing (' + str(space) + '). Please check material geometry.\n')
     if space < 1.5:
         print('Warning! The material ' + str(material) + ' has a SMALL ghost atom spacing (' + str(space) + '). Please check material geometry.\n')
     #print(space)
-    f = open(DIR+new_SLABd12,'w+')
-    for items in lines_in_d12:
-        f.writelines(items)
-    f.close()
+    with open(DIR+new_SLABd12,'w') as f:
+        f.write("".join(lines_in_d12))
+
+if __name__ == "__main__":
+    with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        list(ex.map(process_one, pathlist))
@@ -7,33 +7,31 @@ Created on Tue Jun 28 09:50:36 2022
 """
 
 import os
+import re
+from pathlib import Path
 import pandas as pd
 
+# A SHRINK line, the line after it, and the k-point line we rewrite
+SHRINK_RE = re.compile(r'^(.*SHRINK.*\n.*\n)(.*)$', re.M)
+
+def lowest_k(match):
+    klow = min(list(map(int, match.group(2).split())))
+    return match.group(1) + ' ' + str(klow) + ' ' + str(klow) + ' ' + str(klow)
+
+def find_d12_files(d):
+    # scandir reuses the dirent type, so no extra stat per entry
+    with os.scandir(d) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from find_d12_files(entry.path)
+            elif entry.name.endswith(".d12"):
+                yield Path(entry.path)
+
 file_to_search = os.getcwd()
 
-File = []
-counter = 0
-for rootdir, dirs, files in os.walk(file_to_search):
-    for f in files:
-        if ".d12" in f:
-            with open(rootdir + '/' + f,'r') as fi:
-                l = list(fi)
-            
-            with open(rootdir + '/' + f,'w') as output:
-                for lines in l:
-                    if counter > 0:
-                        counter += 1
-                    if "SHRINK" in lines:
-                        counter += 1
-                    if counter == 3:
-                        print(lines)
-                        
-                        klow = min(list(map(int, lines.split())))
-                        newk = ' ' + str(klow) + ' ' + str(klow) + ' ' + str(klow) + '\n'
-                        
-                        output.write(newk)
-                        counter = 0
-                        
-                    else: 
-                        output.write(lines)
-                        
\ No newline at end of file
+for path in find_d12_files(file_to_search):
+    text = path.read_text()
+    new_text = SHRINK_RE.sub(lowest_k, text)
+    # leave files that are already fixed untouched
+    if new_text != text:
+        path.write_text(new_text)
@@ -1,57 +1,62 @@
 import os
 import sys
-import glob
 import csv
-from csv import writer
+import re
+import mmap
+import concurrent.futures
 from os.path import exists
+from pathlib import Path
 import numpy as np
 
+HA_TO_EV = 27.2114
+# last token on a FERMI ENERGY line
+FERMI_RE = re.compile(rb'FERMI ENERGY[^\n]*?(\S+)[ \t\r]*$', re.M)
+
 def getWF(material):
     file4 = material+'_POTC.POTC.dat'
     file5 = material+'_POTC.out'
 
     if exists(file4) and exists(file5):
-        z = []; V  = [];
         EF=0
-        with open(file5) as f5:
-            for i,line in enumerate(f5):
-                if 'FERMI ENERGY' in line:
-                    EF = float(line.split()[-1])
-        with open(file4) as f:
-            for i,line in enumerate(f):
-                if line.startswith('#') or line.startswith('@'):
-                    continue
-                else:
-                    z.append(float(line.split()[0]))
-                    V.append(float(line.split()[1]))
+        # the last FERMI ENERGY line wins, so search back from the end of the file
+        if os.path.getsize(file5):
+            with open(file5,'rb') as f5, mmap.mmap(f5.fileno(),0,access=mmap.ACCESS_READ) as mm:
+                i = mm.rfind(b'FERMI ENERGY')
+                if i != -1:
+                    EF = float(FERMI_RE.match(mm,i).group(1))
+        # only the potential column is needed, and only its two ends (ndmin=1 keeps a single row indexable)
+        V = np.loadtxt(file4, comments=('#','@'), usecols=1, ndmin=1)
         
-        Vtop = V[0]*27.2114
-        Vbot = V[-1]*27.2114
+        Vtop = V[0]*HA_TO_EV
+        Vbot = V[-1]*HA_TO_EV
         Vmax = np.max([Vtop,Vbot])
         Vmin = np.min([Vtop,Vbot])
         Vavg = (Vtop+Vbot)/2
-        WF0 = (V[0]-EF)*27.2114
-        WF1 = (V[-1]-EF)*27.2114
+        WF0 = (V[0]-EF)*HA_TO_EV
+        WF1 = (V[-1]-EF)*HA_TO_EV
         WFmax = np.max([WF0,WF1])
         WFmin = np.min([WF0,WF1])
-        EF_eV = EF*27.2114
+        EF_eV = EF*HA_TO_EV
 
-        list_data = [material,Vtop,Vbot,WF0,WF1,WFmax,WFmin,Vmax,Vmin,Vavg,EF_eV]
-        writer.writerow(list_data)
+        return [material,Vtop,Vbot,WF0,WF1,WFmax,WFmin,Vmax,Vmin,Vavg,EF_eV]
 
-with open("WF.csv","w") as out:
-    writer = csv.writer(out)
-    writer.writerow(["Material","EPOT top (eV)","EPOT bot (eV)","WF top (eV)", "WF bot (eV)","WFmax (eV)","WFmin (eV)","EPOTmax (eV)","EPOTmin (eV)","EPOTavg (eV)","EFermi (eV)"])
-    
+if __name__ == "__main__":
     DIR = (os.getcwd()+'/')
-    pathlist = glob.glob(DIR+'*_POTC.POTC.dat')
-    nDIR = len(DIR)
+    pathlist = sorted(Path(DIR).glob('*_POTC.POTC.dat'))
     ntype = len("_POTC.POTC.dat")
 
+    materials = []
     for path in pathlist:
-        path_in_str = str(path)
-        material = path_in_str[nDIR:-ntype]
+        material = path.name[:-ntype]
         if material == "":break
         print('Material '+material)
-        getWF(material)
-out.close()
\ No newline at end of file
+        materials.append(material)
+
+    # materials are independent; map keeps the rows in pathlist order
+    with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        rows = list(ex.map(getWF, materials))
+
+    with open("WF.csv","w") as out:
+        csv_writer = csv.writer(out)
+        csv_writer.writerow(["Material","EPOT top (eV)","EPOT bot (eV)","WF top (eV)", "WF bot (eV)","WFmax (eV)","WFmin (eV)","EPOTmax (eV)","EPOTmin (eV)","EPOTavg (eV)","EFermi (eV)"])
+        csv_writer.writerows(row for row in rows if row)
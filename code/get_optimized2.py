@@ -12,68 +12,53 @@ Modified by Wangwei Lan, Marcus Djokic, and Danny Maldonado
 
 import os, sys, math
 import re
+import mmap
+import bisect
 import linecache
 
+FINAL_GEOM = " FINAL OPTIMIZED GEOMETRY"
+CRYST_CELL = " CRYSTALLOGRAPHIC CELL"
+ALPHA_HDR  = "           ALPHA      BETA       GAMMA"
+CART_CRYS  = "COORDINATES IN THE CRYSTALLOGRAPHIC CELL"
+ASYM       = "ATOMS IN THE ASYMMETRIC UNIT"
+#optimization keywords stripped from the new d12
+KEYWORD_RE = re.compile(r"OPTGEOM|MAXCYCLE|MAXTRADIUS|SUPERCEL|EXCHSIZE|SLABCUT|FULLOPTG|ENDOPT|ENDGEOM")
+#number of lines following each keyword that are dropped with it
+KEYWORD_SKIP = {"OPTGEOM": 0, "MAXCYCLE": 1, "MAXTRADIUS": 2, "SUPERCEL": 4, "EXCHSIZE": 1,
+                "SLABCUT": 2, "FULLOPTG": 0, "ENDOPT": 0, "ENDGEOM": 0}
+#unit cell line of the d12 for each crystal system, picked by the highest
+#spacegroup number of the system (triclinic, monoclinic, orthorhombic,
+#tetragonal/trigonal/hexagonal, cubic)
+SG_MAX = [2, 15, 74, 194, 230]
+CELL_FORMATS = [
+   lambda c: "%1s %8s %8s %8s %8s %8s\n"%(c[0], c[1], c[2], c[3], c[4], c[5]),
+   #the monoclinic angle is whichever one is not 90
+   lambda c: "%1s  %19s %19s %19s\n"%(c[0], c[1], c[2], next((x for x in c[3:6] if x != "90.000000"), c[4])),
+   lambda c: "%1s %19s %19s\n"%(c[0], c[1], c[2]),
+   lambda c: "%1s %19s\n"%(c[0], c[2]),
+   lambda c: "%1s\n"%(c[0]),
+]
+
+
+"""RETURNS THE LINES OF THE OUTPUT FILE AFTER FINAL OPTIMIZED GEOMETRY"""
+def final_geometry(filename):
+   #map the output file and jump straight to FINAL OPTIMIZED GEOMETRY
+   with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+      start = mm.find(b"\n" + FINAL_GEOM.encode())
+      if start == -1:
+         return []
+      #skip the FINAL OPTIMIZED GEOMETRY line itself
+      start = mm.find(b"\n", start+1)
+      if start == -1:
+         return []
+      return mm[start+1:].decode().splitlines(True)
 
-"""RETURNS THE PRIMITIVE CELL VALUES"""
-def primitive_cell(filename):
-   #open output file
-   cryout = open(filename, 'r')
-   primitive_cell = [] #takes cell parameters
-   for line in cryout:
-      #if line.find(" FINAL OPTIMIZED GEOMETRY - ", 0,len(line)) == 0:
-      #exit loop and loop through final optimized geometry values
-      if re.match(r"^ FINAL OPTIMIZED GEOMETRY", line):
-         break
-   #Begin to read at FINAL OPTIMIZED GEOMETRY      
-   for line in cryout:
-      #if there is a blank line, exit
-      if not line.strip():
-         continue
-      if re.match(r"^ PRIMITIVE CELL", line):
-         line=next(cryout)
-      if re.search(r"           ALPHA      BETA       GAMMA", line):
-         value= next(cryout).split()
-         primitive_cell=value
-         break
-   cryout.close()
-   return primitive_cell
-
-""" RETURNS THE CONVENTIONAL UNIT CELL LATTICE PARAMETER"""
-def conventional_cells(filename):
-   #open output file
-   cryout = open(str(filename), 'r')
-   conventional_cell=[] #store the structure information
-   tmp=""
-   isconventional = False
-   for line in cryout:
-      if re.match(r"^ FINAL OPTIMIZED GEOMETRY", line):
-         break
-   #Begin to read at FINAL OPTIMIZED GEOMETRY      
-   for line in cryout:
-         #if there is a blank line, exit
-      if not line.strip():
-         continue
-      if re.match(r"^ CRYSTALLOGRAPHIC CELL", line):
-         line=next(cryout)
-         if re.search(r"           ALPHA      BETA       GAMMA", line):
-            value= next(cryout).split()
-            conventional_cell=value
-            isconventional = True
-            break
-
-   if not isconventional:
-         conventional_cell=primitive_cell(filename)
-
-   cryout.close()
-   return conventional_cell
-      
 """ RETRUN SPACEGROUP OF THIS COMPOUND"""
 def get_spacegroup(filename):
    cryout = open(filename,'r')
    spacegroup=0
    for line in cryout:
-      if re.search("CRYSTAL",line):
+      if "CRYSTAL" in line:
          line=next(cryout)
          value=next(cryout).split()
          spacegroup=value[0]
@@ -83,61 +68,49 @@ def get_spacegroup(filename):
    
 
 
-"""RETURNS A LIST OF THE COORDINATES OF EACH ATOM"""
-def copy_coordinates(filename):
-   opt_geom_total = [] #store atom information
-   atom_num = []       #atom species
-   x_coord = []        #atom coordinates
-   y_coord = []
-   z_coord = [] 
-   isconventional = False
-
-   #if this is conventional unit cell get conventional unit cell parameter
-   with open(filename,'r') as cryout:
-      #Begin to read at FINAL OPTIMIZED GEOMETRY
-      for line in cryout:
-         if re.match(r"^ FINAL OPTIMIZED GEOMETRY", line):
-            break
-      for line in cryout:
-         if re.search(r"COORDINATES IN THE CRYSTALLOGRAPHIC CELL", line):
-            isconventional = True
-            for line in cryout:
-               string_list = line.split()
-               if len(string_list) < 6:
-                  pass
-               elif string_list[1] == "T":
-                  atom_num.append(string_list[2])
-                  x_coord.append(string_list[4])
-                  y_coord.append(string_list[5])
-                  z_coord.append(string_list[6])
-                  
-
-   # if this is primitive unit cell, get primitive unit cell
-   if not isconventional:
-      with open(filename,'r') as cryout:
-      #Begin to read at FINAL OPTIMIZED GEOMETRY
-         for line in cryout:
-            if re.match(r" FINAL OPTIMIZED GEOMETRY", line):
-               break
-         for line in cryout:
-            if re.search(r"ATOMS IN THE ASYMMETRIC UNIT", line):
-               for line in cryout:
-                  string_list = line.split()
-                  if len(string_list) < 6:
-                     pass
-                  elif string_list[1] == "T":
-                     atom_num.append(string_list[2])
-                     x_coord.append(string_list[4])
-                     y_coord.append(string_list[5])
-                     z_coord.append(string_list[6])
-
-   #put all atom information together
-   opt_geom_total.append(atom_num)
-   opt_geom_total.append(x_coord)
-   opt_geom_total.append(y_coord)
-   opt_geom_total.append(z_coord)
-   cryout.close()
-   return opt_geom_total
+"""RETURNS THE CONVENTIONAL UNIT CELL LATTICE PARAMETER AND THE COORDINATES OF EACH ATOM"""
+def parse_out(filename):
+   geom_lines = final_geometry(filename)
+   primitive_cell = []    #primitive cell parameters
+   conventional_cell = [] #crystallographic cell parameters, if printed
+   crys_atoms = None      #atom lines after COORDINATES IN THE CRYSTALLOGRAPHIC CELL
+   asym_atoms = None      #atom lines after ATOMS IN THE ASYMMETRIC UNIT
+
+   #single pass over everything after FINAL OPTIMIZED GEOMETRY
+   for n, line in enumerate(geom_lines):
+      if crys_atoms is not None or asym_atoms is not None:
+         string_list = line.split()
+         is_atom = len(string_list) >= 7 and string_list[1] == "T"
+      if crys_atoms is not None:
+         if is_atom:
+            crys_atoms.append(string_list)
+      elif CART_CRYS in line:
+         crys_atoms = []
+      if asym_atoms is not None:
+         if is_atom:
+            asym_atoms.append(string_list)
+      elif ASYM in line:
+         asym_atoms = []
+      #the first cell header after FINAL OPTIMIZED GEOMETRY is the primitive cell
+      if not primitive_cell and ALPHA_HDR in line and n+1 < len(geom_lines):
+         primitive_cell = geom_lines[n+1].split()
+      if not conventional_cell and line.startswith(CRYST_CELL) and n+2 < len(geom_lines):
+         if ALPHA_HDR in geom_lines[n+1]:
+            conventional_cell = geom_lines[n+2].split()
+
+   #fall back to the primitive cell when there is no conventional cell
+   if not conventional_cell:
+      conventional_cell = primitive_cell
+
+   #if this is conventional unit cell use its atoms, otherwise the asymmetric unit
+   if crys_atoms is not None:
+      atoms = crys_atoms
+   else:
+      atoms = asym_atoms or []
+   #put all atom information together: species, x, y, z
+   opt_geom_total = [[a[2] for a in atoms], [a[4] for a in atoms],
+                     [a[5] for a in atoms], [a[6] for a in atoms]]
+   return conventional_cell, opt_geom_total
    
 """FINDS THE ATOM NUMBER OF MN, AND RETURNS A STRING TO PLACE INTO ATOMSPIN"""
 # def atomspin(atom_num):
@@ -157,7 +130,7 @@ def modify_d12(existingd12, newd12, opt_geom_total, conventional_cell, spacegrou
 
    for line in existingd12:
       #brings you to the number of atoms in the cell of the existing d12
-      if re.match(r"^CRYSTAL", line):
+      if line.startswith("CRYSTAL"):
          newd12.write(line)
          newd12.write(next(existingd12))
          newd12.write(next(existingd12))
@@ -172,24 +145,10 @@ def modify_d12(existingd12, newd12, opt_geom_total, conventional_cell, spacegrou
       next(existingd12)
 
    # prints the unit cell parameter, according to the spacegroup the compound has
-   if int(spacegroupNM) < 3:
-      newd12.write("%1s %8s %8s %8s %8s %8s\n"%(conventional_cell[0],conventional_cell[1],conventional_cell[2],conventional_cell[3],conventional_cell[4],conventional_cell[5]))
-   elif int(spacegroupNM) >= 3 and int(spacegroupNM) <= 15:
-      for i in (3,5):
-         if conventional_cell[i] != "90.000000":
-            newd12.write("%1s  %19s %19s %19s\n"%(conventional_cell[0],conventional_cell[1],conventional_cell[2],conventional_cell[i]))
-         break
-   elif int(spacegroupNM) >= 16 and int(spacegroupNM) <= 74:
-      newd12.write("%1s %19s %19s\n"%(conventional_cell[0], conventional_cell[1], conventional_cell[2]))
-   elif int(spacegroupNM) >= 75 and int(spacegroupNM) <= 142:
-      newd12.write("%1s %19s\n"%(conventional_cell[0],conventional_cell[2]))
-   elif int(spacegroupNM) >= 143 and int(spacegroupNM) <= 167:
-      newd12.write("%1s %19s\n"%(conventional_cell[0],conventional_cell[2]))
-   elif int(spacegroupNM) >= 168 and int(spacegroupNM) <= 194:
-      newd12.write("%1s %19s\n"%(conventional_cell[0],conventional_cell[2]))
-   elif int(spacegroupNM) >= 195 and int(spacegroupNM) <= 230:
-      newd12.write("%1s\n"%(conventional_cell[0]))
-      
+   sg = int(spacegroupNM)
+   if sg <= SG_MAX[-1]:
+      newd12.write(CELL_FORMATS[bisect.bisect_left(SG_MAX, sg)](conventional_cell))
+
    total_atoms = len(opt_geom_total[0])
    # write the number of atoms
    newd12.write(str(total_atoms) +"\n")
@@ -199,35 +158,17 @@ def modify_d12(existingd12, newd12, opt_geom_total, conventional_cell, spacegrou
    #Search through parameters, skips until first end
    #Writes the first end
    for line in existingd12:
-      if re.search(r"OPTGEOM", line):
-         pass
-      elif re.search(r"MAXCYCLE", line):
-         next(existingd12)
-         pass
-      elif re.search(r"MAXTRADIUS", line):
-         next(existingd12)
-         next(existingd12)
-         pass
-      elif re.search(r"SUPERCEL", line):
-         next(existingd12)
-         next(existingd12)
-         next(existingd12)
+      m = KEYWORD_RE.search(line)
+      if m is None:
+         newd12.write(line)
+         continue
+      #drop the keyword together with its value lines
+      for i in range(KEYWORD_SKIP[m.group()]):
          next(existingd12)
-         pass
       #Crude fix, we don't want to remove the SCF MAXCYCLE 
-      elif re.search(r"EXCHSIZE", line):
-         next(existingd12)
+      if m.group() == "EXCHSIZE":
          newd12.write("MAXCYCLE\n")
          newd12.write("800\n")
-         pass
-      elif re.search(r"SLABCUT", line):
-         next(existingd12)
-         next(existingd12) 
-         pass
-      elif re.search(r"FULLOPTG", line):
-         pass
-      elif re.search(r"ENDOPT", line):
-         pass
       # elif re.search(r"ATOMSPIN", line):
       #    ATOMSPIN = atomspin(opt_geom_total[0])
       #    newd12.write("ATOMSPIN\n")
@@ -236,10 +177,6 @@ def modify_d12(existingd12, newd12, opt_geom_total, conventional_cell, spacegrou
       #    pass
          # for item in ATOMSPIN:
          #    newd12.write(item+"\n")
-      elif re.search(r"ENDGEOM",line):
-         pass
-      else:
-         newd12.write(line)
    existingd12.close()
    newd12.close()
 
@@ -256,18 +193,14 @@ if __name__ == "__main__":
        newd12  = open(str(submit_name)+"_optimized.d12",'w')
 
        print(outputfile)
-       # get conventional unit cell parameter
-       conventional_cell = conventional_cells(outputfile)
-    
-       #gets the coordinates of the atoms
-    
-       opt_geom_total = copy_coordinates(outputfile)
+       # get conventional unit cell parameter and the coordinates of the atoms
+       conventional_cell, opt_geom_total = parse_out(outputfile)
     
        #get spacegroup of this compound
        spacegroupNM=get_spacegroup(str(submit_name)+".d12")
     
        #creates a new d12 from the existing d12
-       if spacegroupNM == "P" or spacegroupNM == "C" or spacegroupNM == "A" or spacegroupNM == "F" or spacegroupNM == "I":
+       if spacegroupNM in ("P", "C", "A", "F", "I"):
           print ("The spacegroup is written in HM form, please change it!!")
        else:
           modify_d12(existingd12, newd12, opt_geom_total, conventional_cell, spacegroupNM) 
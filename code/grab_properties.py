@@ -3,16 +3,17 @@ import warnings
 import numpy as np
 import glob
 import math
-import matplotlib
-matplotlib.use('tkagg') # <-- THIS MAKES IT FAST!
-import matplotlib.pyplot as plt
 import csv
 import os
+import concurrent.futures
 
 
-def nCr(n,r):
-    f = math.factorial
-    return f(n) / f(r) / f(n-r)
+# Sum of the distances between every pair of rows (atoms) of P
+# Only the i<j pairs are formed, so no (n,n,3) buffer is built
+def iad_sum(P):
+    i, j = np.triu_indices(len(P), 1)
+    diff = P[i] - P[j]
+    return np.sqrt((diff*diff).sum(1)).sum()
 
 DIR      = "/home/daniel/Desktop/Work/2DMat/get_properties_singlepoint/out/"
 pathlist = glob.glob(DIR+'*_slab.out')
@@ -25,209 +26,156 @@ CART   = " CARTESIAN COORDINATES - PRIMITIVE CELL"
 ENERGY = " * OPT END - CONVERGED * E(AU):"
 INDGAP = " INDIRECT ENERGY BAND GAP:"
 DIRGAP = " DIRECT ENERGY BAND GAP:"
+NATOMS = " NUMBER OF IRREDUCIBLE"
+ASYM   = " ATOMS IN THE ASYMMETRIC UNIT"
+COND   = " POSSIBLY CONDUCTING STATE"
 HeV    = 27.2114
 #################################################################################
 
-with open("HSE06_PROPERTIES.csv","w") as out:
-  writer = csv.writer(out)
-  #               table = [material,Ebg_slb,GAPTYPE_slb,Ebg_blk,GAPTYPE_blk,E_slb,E_blk,Eb,IAD_slb,IAD_blk,state_slb,state_blk,dens,mass,atoms,space]
-  writer.writerow(["Material","Eg (slab)","Type","Eg (bulk)","Type","E (slab)","E (bulk)","Eb","IAD (slab)","IAD (bulk)","State (slab)","State (bulk)","Dens (bulk)","Mass","Atoms","Vacuum"])
+# Handlers for the section headers of a CRYSTAL output. Each one gets the
+# parse state s, the line number i and the line, and only records where the
+# section starts; the rows that follow are read in parse_crystal_out
+def on_atoms(s, i, line):
+  # the atom arrays are sized by the first atom count and kept after that
+  if s["atoms"]: return
+  s["atoms"]  = int(line.split()[-1])
+  s["el"]     = np.zeros(s["atoms"])
+  s["coords"] = np.zeros((s["atoms"],3))
+  s["z_c"]    = np.zeros(s["atoms"])
+  s["z_new"]  = np.zeros(s["atoms"])
+
+def on_cart(s, i, line):
+  s["md"] = i
+  s["k"]  = 0
+
+def on_lat(s, i, line):
+  s["id"] = i
+
+def on_asym(s, i, line):
+  s["g"] = i
+
+def on_cond(s, i, line):
+  s["state"] = "COND"
+  s["Ebg"]   = 0.
+
+def on_gap(s, i, line):
+  s["Ebg"]     = float(line.split()[-2])
+  s["GAPTYPE"] = "INDIRECT" if line.startswith(INDGAP) else "DIRECT"
+
+# Section headers are looked up by the first NKEY characters of a line, so
+# ordinary lines cost one dict lookup instead of a chain of startswith tests.
+# The full header is still checked, since e.g. the conventional cell shares
+# the prefix of the primitive one
+NKEY  = 22
+TABLE = {NATOMS[:NKEY]: (NATOMS, on_atoms), CART[:NKEY]: (CART, on_cart),
+         LAT[:NKEY]: (LAT, on_lat), ASYM[:NKEY]: (ASYM, on_asym),
+         COND[:NKEY]: (COND, on_cond), INDGAP[:NKEY]: (INDGAP, on_gap),
+         DIRGAP[:NKEY]: (DIRGAP, on_gap)}
+# the fractional z of the asymmetric unit is only needed for the bulk
+SLAB_TABLE = {key: hit for key, hit in TABLE.items() if key != ASYM[:NKEY]}
+
+# Reads one CRYSTAL output and returns its parse state: atoms, el, coords,
+# cell (A,B,C,alpha,beta,gamma,V), E, Ebg, GAPTYPE, state, z_c and z_new
+def parse_crystal_out(path, table=TABLE):
+  # the atom arrays are sized once NUMBER OF IRREDUCIBLE ATOMS is read
+  s = {"atoms": 0, "el": np.zeros(0), "coords": np.zeros((0,3)), "k": 0,
+       "md": 9999, "id": 9999, "g": 9999, "cell": None,
+       "E": 999999, "Ebg": 999999, "GAPTYPE": "Null", "state": "Null",
+       "z_c": np.zeros(0), "z_new": np.zeros(0)}
+  with open(path,'r') as f:
+    for i, line in enumerate(f):
+      hit = table.get(line[:NKEY])
+      if hit and line.startswith(hit[0]):
+        hit[1](s, i, line)
+      if " PROCESS" in line:
+        s["md"] += 1
+        continue
+
+      # CARTESIAN POSITIONS OF THE ATOMS
+      if s["md"]+4 <= i <= s["md"]+s["atoms"]+3:
+        vals = line.split()
+        k = s["k"]
+        s["el"][k] = float(vals[-5])
+        if s["el"][k] >200: s["el"][k] -=200
+        s["coords"][k] = (float(vals[-3]), float(vals[-2]), float(vals[-1]))
+        s["k"] = k+1
+
+      # THE OPTIMIZED PRIMITIVE CELL (ANG. and DEG.)
+      if i == s["id"]+2:
+        s["cell"] = [float(x) for x in line.split()[:7]]
+
+      # FRACTIONAL z OF THE ASYMMETRIC UNIT
+      if s["g"]+3 <= i <= s["g"]+s["atoms"]+2:
+        j = i-s["g"]-3
+        s["z_c"][j] = float(line.split()[6])
+        z = s["coords"][j,2]
+        s["z_new"][j] = z + 1.0 if z < 0. else z
+
+      # TOTAL ENERGY
+      if "ETOT(AU)" in line:
+        s["E"] = float(line.split()[3])
+
+  if s["Ebg"] <9. and s["Ebg"] >0.:     s["state"] = "SEMI"
+  if s["Ebg"] >9. and s["Ebg"] < 10000: s["state"] = "INSU"
+  return s
+
+
+# Parses the slab and bulk outputs of one material and returns its CSV row.
+# Both outputs must exist; the driver only passes materials that have them
+def process_material(material):
+  SLAB     = DIR+material+"_slab.out"
+  BULK     = DIR+material+"_bulk.out"
+  print(material)
+
+  #:::::::::::::::   SLAB ANALYSIS   ::::::::::::::::::::::
+  slb = parse_crystal_out(SLAB, SLAB_TABLE)
+  IAD_slb = 999999
+  if slb["Ebg"] <= 100:
+    N       = slb["atoms"]*(slb["atoms"]-1)*0.5   # number of atom pairs
+    IAD_slb = iad_sum(slb["coords"])/N
+
+  #:::::::::::::::   BULK ANALYSIS   ::::::::::::::::::::::
+  blk = parse_crystal_out(BULK)
+  if blk["Ebg"] >100: return None
+  atoms    = blk["atoms"]
+  N        = atoms*(atoms-1)*0.5   # number of atom pairs
+  IAD_blk  = iad_sum(blk["coords"])/N
+  mass     = blk["el"].sum()
+  A, B, C, alpha, beta, gamma, V = blk["cell"]
+  z_c, z_new = blk["z_c"], blk["z_new"]
+
+  # height of the cell along z, computed once for either vacuum estimate
+  cos_a, cos_b, cos_g = math.cos(math.radians(alpha)), math.cos(math.radians(beta)), math.cos(math.radians(gamma))
+  height = (C/math.sin(math.radians(gamma)))*math.sqrt(1-cos_a**2-cos_b**2-cos_g**2+2*cos_a*cos_b*cos_g)
+  if (1+min(z_c)-max(z_c)) > 0.001:
+    space = ((1+min(z_c))-max(z_c))*height
+  elif (1+min(z_c)-max(z_c)) < 0.001:
+    space = ((1-max(z_new)+min(z_new)))*height
+  Eb     = (blk["E"]-slb["E"])*HeV
+  dens   = float(mass)/V
+  table = [material,slb["Ebg"],slb["GAPTYPE"],blk["Ebg"],blk["GAPTYPE"],slb["E"],blk["E"],Eb,IAD_slb,IAD_blk,slb["state"],blk["state"],dens,mass,atoms,space]
+  return table
+
+
+if __name__ == "__main__":
+  # names in DIR, read once so the bulk check is a set lookup and not a stat()
+  with os.scandir(DIR) as it:
+    files = {e.name for e in it if e.is_file()}
+  materials = []
   for path in pathlist:
-            # because path is object not string
+      # because path is object not string
       path_in_str = str(path)
       material = path_in_str[nDIR:-ntype]
       if material == "":break
-      #print(material)
-
-      FERMI    = "   FERMI ENERGY:"
-      DONE     = " * OPT END - CONVERGED"
-      GEOM     = " FINAL OPTIMIZED GEOMETRY"
-      COND     = " POSSIBLY CONDUCTING STATE"
-
-      SLAB     = material+"_slab.out"
-      BULK     = material+"_bulk.out"
-
-      if os.path.exists(DIR+SLAB) and os.path.exists(DIR+BULK):
-        print(material)
-        with open(DIR+SLAB,'r') as slb, open(DIR+BULK,'r') as blk:
-          #:::::::::::::::   SLAB ANALYSIS   ::::::::::::::::::::::
-          el = np.zeros(99)
-          x  = np.zeros(99)
-          y  = np.zeros(99)
-          z  = np.zeros(99)
-
-          id  = 9999
-          md  = 9999
-          atoms    = 99
-          k        = 0
-          switch   = 0
-          E_slb    = 999999
-          IAD_slb  = 999999
-          state_slb    = "Null"
-          Ebg_slb      = 999999
-          GAPTYPE_slb  = "Null"
-          for i, line in enumerate(slb):
-            # GET CARTESIAN POSTIONS FOR ATOMS
-            if line.startswith(" NUMBER OF IRREDUCIBLE"):
-              atoms = int(line.split()[-1])
-            if line.startswith(CART):
-              md    = i 
-            if " PROCESS" in line: 
-              md+=1
-              continue
-            if md+4 <= i and i <= md+atoms+3:
-               el[i-md-5] = float(line.split()[-5])
-               if el[i-md-5] >200:el[i-md-11] -=200
-               x[i-md-5] = float(line.split()[-3])
-               y[i-md-5] = float(line.split()[-2])
-               z[i-md-5] = float(line.split()[-1])
-
-            # GET THE INFORMATION ON THE PRIMITIVE CELL (ANG. and DEG.)
-            if LAT in line:
-              id = i  
-            if i == id+2:
-                # FIND THE OPTIMIZED PRIMITIVE CELL
-                cell    = line.split()
-                A       = float(cell[0])
-                B       = float(cell[1])
-                C       = float(cell[2])
-                alpha   = float(cell[3])
-                beta    = float(cell[4])
-                gamma   = float(cell[5])
-                V       = float(cell[6])
-
-            if line.startswith(COND):
-              state_slb = "COND"
-              Ebg_slb   = 0.
-
-
-            # TOTAL ENERGY OF THE SLAB
-            if "ETOT(AU)" in line:
-              E_slb = float(line.split()[3])
-              #print("ETOT(AU)",E_slb)
-
-
-            # BANDGAP FOR SLAB
-            if line.startswith(INDGAP) or line.startswith(DIRGAP):
-              Ebg_slb = float(line.split()[-2])
-              if line.startswith(INDGAP):
-                GAPTYPE_slb = "INDIRECT"
-              if line.startswith(DIRGAP):
-                GAPTYPE_slb = "DIRECT"
-              #print(line)
-
-            if Ebg_slb <9. and Ebg_slb >0.:     state_slb = "SEMI"
-            if Ebg_slb >9. and Ebg_slb < 10000: state_slb = "INSU"
-            if Ebg_slb >100: continue
-            N   = float(nCr(atoms,2))
-            d        = 0.
-            for i in range(0,atoms):
-               for j in range(i,atoms):
-                  d += np.sqrt((x[i]-x[j])**2.+(y[i]-y[j])**2.+(z[i]-z[j])**2)
-            IAD_slb  = d/N
-            mass     = sum(el)
-            el = np.zeros(20)
-
-
-          #:::::::::::::::   BULK ANALYSIS   ::::::::::::::::::::::
-          el = np.zeros(99)
-          x  = np.zeros(99)
-          y  = np.zeros(99)
-          z  = np.zeros(99)
-          z_c  = np.zeros(99)
-          z_new = np.zeros(99)
-
-          id  = 9999
-          md  = 9999
-          g = 9999         
-          atoms    = 99
-          d        = 0.
-          k        = 0
-          switch   = 0
-          E_blk    = 999999
-          IAD_blk  = 999999
-          state_blk    = "Null"
-          Ebg_blk      = 9999999
-          GAPTYPE_blk  = "Null"
-          for i, line in enumerate(blk):
-            # GET CARTESIAN POSTIONS FOR ATOMS
-            if line.startswith(" NUMBER OF IRREDUCIBLE"):
-              atoms = int(line.split()[-1])
-            if line.startswith(CART):
-              md    = i 
-            if " PROCESS" in line: 
-              md+=1
-              continue
-            if md+4 <= i and i <= md+atoms+3:
-               el[i-md-5] = float(line.split()[-5])
-               if el[i-md-5] >200:el[i-md-11] -=200
-               x[i-md-5] = float(line.split()[-3])
-               y[i-md-5] = float(line.split()[-2])
-               z[i-md-5] = float(line.split()[-1])
-            # GET THE INFORMATION ON THE PRIMITIVE CELL (ANG. and DEG.)
-            if LAT in line:
-              id = i  
-            if i == id+2:
-                # FIND THE OPTIMIZED PRIMITIVE CELL
-                cell    = line.split()
-                A       = float(cell[0])
-                B       = float(cell[1])
-                C       = float(cell[2])
-                alpha   = float(cell[3])
-                beta    = float(cell[4])
-                gamma   = float(cell[5])
-                V       = float(cell[6])
-                ang_alpha = math.radians(alpha)
-                ang_beta = math.radians(beta)
-                ang_gamma = math.radians(gamma)
-
-            if line.startswith(" ATOMS IN THE ASYMMETRIC UNIT"):
-                g = i
-            if i>=g+3 and i<=g+3+atoms-1:
-                z_c[i-g-3] = float(line.split()[6])
-                if z[i-g-3] < 0.:
-                    z_new[i-g-3] = z[i-g-3] + 1.0
-                else:
-                    z_new[i-g-3] = z[i-g-3]
-
-            if line.startswith(COND):
-              state_blk = "COND"
-              Ebg_blk   = 0.
-
-
-            # TOTAL ENERGY OF THE BULK
-            if "ETOT(AU)" in line:
-              E_blk = float(line.split()[3])
-              #print("ETOT(AU)",E_blk)
-
-
-            # BANDGAP FOR BULK
-            if line.startswith(INDGAP) or line.startswith(DIRGAP):
-              Ebg_blk = float(line.split()[-2])
-              if line.startswith(INDGAP):
-                GAPTYPE_blk = "INDIRECT"
-              if line.startswith(DIRGAP):
-                GAPTYPE_blk = "DIRECT"
-              #print(line)
-
-          if Ebg_blk <9. and Ebg_blk >0.:     state_blk = "SEMI"
-          if Ebg_blk >9. and Ebg_blk < 10000: state_blk = "INSU"
-          if Ebg_blk >100: continue
-          N   = float(nCr(atoms,2))
-          d   = 0.
-          for i in range(0,atoms):
-             for j in range(i,atoms):
-                d += np.sqrt((x[i]-x[j])**2.+(y[i]-y[j])**2.+(z[i]-z[j])**2)
-          IAD_blk  = d/N
-          mass     = sum(el)
-
-          if (1+min(z_c)-max(z_c)) > 0.001:
-            space = ((1+min(z_c))-max(z_c))*(C/math.sin(ang_gamma))*math.sqrt(1-math.cos(ang_alpha)**2-math.cos(ang_beta)**2-math.cos(ang_gamma)**2+2*math.cos(ang_alpha)*math.cos(ang_beta)*math.cos(ang_gamma))
-          elif (1+min(z_c)-max(z_c)) < 0.001:
-            space = ((1-max(z_new)+min(z_new)))*(C/math.sin(ang_gamma))*math.sqrt(1-math.cos(ang_alpha)**2-math.cos(ang_beta)**2-math.cos(ang_gamma)**2+2*math.cos(ang_alpha)*math.cos(ang_beta)*math.cos(ang_gamma))
-          Eb     = (E_blk-E_slb)*HeV
-          dens   = float(mass)/V
-          table = [material,Ebg_slb,GAPTYPE_slb,Ebg_blk,GAPTYPE_blk,E_slb,E_blk,Eb,IAD_slb,IAD_blk,state_slb,state_blk,dens,mass,atoms,space]
-          writer.writerow(table)
-      else: continue
-out.close()
+      if material+"_bulk.out" in files:
+        materials.append(material)
+
+  # materials are independent; rows are collected in pathlist order and written at once
+  with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+    rows = [table for table in ex.map(process_material, materials) if table]
+
+  with open("HSE06_PROPERTIES.csv","w") as out:
+    writer = csv.writer(out)
+    #               table = [material,Ebg_slb,GAPTYPE_slb,Ebg_blk,GAPTYPE_blk,E_slb,E_blk,Eb,IAD_slb,IAD_blk,state_slb,state_blk,dens,mass,atoms,space]
+    writer.writerow(["Material","Eg (slab)","Type","Eg (bulk)","Type","E (slab)","E (bulk)","Eb","IAD (slab)","IAD (bulk)","State (slab)","State (bulk)","Dens (bulk)","Mass","Atoms","Vacuum"])
+    writer.writerows(rows)
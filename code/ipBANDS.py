@@ -11,129 +11,136 @@ python ipBANDS.py -5 5
 """
 import os
 import sys
+import re
+import mmap
+import zipfile
+import concurrent.futures
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.ticker import ScalarFormatter,AutoMinorLocator
 import matplotlib as mpl
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import glob
-from matplotlib import rc
-import math as m
-from matplotlib.cm import get_cmap
+from matplotlib.collections import LineCollection
 from os.path import exists
 
 mpl.rcParams.update(mpl.rcParamsDefault)
+# keep SVG text as <text> instead of converting every glyph to a path
+mpl.rcParams['svg.fonttype'] = 'none'
+
+HA_TO_EV = 27.2114
+# comment and xmgrace lines of a .BAND.dat; everything else is numbers
+META_RE  = re.compile(rb'^[#@].*\n?', re.M)
 
 E_l = float(sys.argv[1])
 E_u = float(sys.argv[2])
 
+# Returns the k-path coordinate and the M bands (in eV, shifted by maxV) of N k-points.
+# CRYSTAL wraps rows with over 1000 bands across lines, so all the numbers are
+# parsed at once (in C, with no per-token Python strings) and reshaped into
+# rows of M+1 values.
+def read_bands(rows, N, M, maxV):
+    E     = np.zeros(N)
+    BANDS = np.zeros((N,M))
+    data  = np.fromstring(b"".join(rows), dtype=np.float64, sep=" ").reshape(-1, M+1)
+    E[:len(data)]     = data[:,0]
+    # scaled and shifted in place, without temporaries
+    np.multiply(data[:,1:], HA_TO_EV, out=BANDS[:len(data)])
+    BANDS[:len(data)] += maxV
+    return E, BANDS
+
+# All the bands as one LineCollection (one artist, drawn in a single call) instead of
+# one Line2D per band; segments are (M, N, 2) arrays of (k, E) points.
+# The bands are rasterized, so the SVG embeds them as one image at the savefig dpi
+# instead of a path per band (axes, ticks and labels stay vector).
+def band_lines(E, BANDS, **kwargs):
+    segs = np.empty((BANDS.shape[1], len(E), 2))
+    segs[:,:,0] = E
+    segs[:,:,1] = BANDS.T
+    return LineCollection(segs, rasterized=True, **kwargs)
+
+# Parses a .BAND.dat: the alpha and beta bands (in eV, shifted by maxV), the x-axis ticks and the fermi energy
+def parse_bands(file2, maxV):
+    ef     = 0.
+    x_labels = []
+
+    with open(file2,'rb') as fb, mmap.mmap(fb.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # Initiate variables
+        header = mm.readline().split()
+        N = int(header[2])
+        M = int(header[4])
+        # Only the #/@ lines are visited one by one; the numbers between them are
+        # sliced out of the mapping whole. Data before the first EFERMI line are
+        # alpha bands, the rest are beta
+        rows = [[],[]]
+        meta = []
+        alpha_beta_counter = 0
+        start = mm.tell()
+        for match in META_RE.finditer(mm, start):
+            rows[alpha_beta_counter].append(mm[start:match.start()])
+            start = match.end()
+            line  = match.group()
+            meta.append(line)
+            if line.startswith(b"# EFERMI (HARTREE)"): # fermi energy
+                ef = float(line.split()[-1])*HA_TO_EV
+                alpha_beta_counter = 1
+        rows[alpha_beta_counter].append(mm[start:])
+    # Get the x-axis ticks: "@ XAXIS TICK SPEC n" is followed by n tick lines,
+    # each one followed by its label line
+    for l,line in enumerate(meta):
+        if line.startswith(b"@ XAXIS TICK SPEC"):
+            n_labels = int(line.split()[-1])
+            x_labels.extend(float(tick.split()[-1]) for tick in meta[l+1:l+2*n_labels:2])
+    E, BANDS = read_bands(rows[0], N, M, maxV)
+    Ebeta, BANDSbeta = read_bands(rows[1], N, M, maxV)
+    return E, BANDS, Ebeta, BANDSbeta, x_labels, ef
+
+# The parsed bands are cached next to the .dat, so plotting again (e.g. with another E_l/E_u) skips
+# the parse. The cache is only used while it is newer than the .dat and was made with the same maxV;
+# a cache that cannot be read is parsed again and overwritten. It is written under a temporary name
+# and then renamed, so an interrupted run never leaves a half-written cache behind.
+def band_data(material, file2, maxV):
+    cache = material+'_BAND.cache.npz'
+    if exists(cache) and os.path.getmtime(cache) > os.path.getmtime(file2):
+        try:
+            with np.load(cache) as c:
+                if c['maxV'] == maxV:
+                    return c['E'], c['BANDS'], c['Ebeta'], c['BANDSbeta'], c['x_labels'].tolist(), float(c['ef'])
+        except (zipfile.BadZipFile, OSError, KeyError, ValueError):
+            pass
+    E, BANDS, Ebeta, BANDSbeta, x_labels, ef = parse_bands(file2, maxV)
+    tmp = cache+'.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez(f, E=E, BANDS=BANDS, Ebeta=Ebeta, BANDSbeta=BANDSbeta, x_labels=x_labels, ef=ef, maxV=maxV)
+    os.replace(tmp, cache)
+    return E, BANDS, Ebeta, BANDSbeta, x_labels, ef
+
 def ipBANDS(material,E_l,E_u):
     file2 = material+'_BAND.BAND.dat'
-    file3 = material+'_BAND.d3'
     file4 = material+'_POTC.POTC.dat'
     file5 = material+'_POTC.out'
 
     #If POTC file exists, open file and look electrostatic potential at inf and Efermi
     if exists(file4) and exists(file5):
-        z = []; V  = [];
         EF=0
-        with open(file5) as f5:
-            for i,line in enumerate(f5):
-                if 'FERMI ENERGY' in line:
-                    EF = float(line.split()[-1])
+        #only the last FERMI ENERGY line counts, so it is searched for from the end of the file
+        #(an empty file, e.g. of a POTC job that has not run, cannot be mapped and keeps EF at 0)
+        if os.path.getsize(file5):
+            with open(file5,'rb') as f5, mmap.mmap(f5.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                i = mm.rfind(b'FERMI ENERGY')
+                if i >= 0:
+                    eol = mm.find(b'\n', i)
+                    EF = float(mm[i:eol if eol >= 0 else len(mm)].split()[-1])
         with open(file4) as f:
-            for i,line in enumerate(f):
-                if line.startswith('#') or line.startswith('@'):
-                    continue
-                else:
-                    z.append(float(line.split()[0]))
-                    V.append(float(line.split()[1]))
-        maxV = -(V[0]-EF)*27.2114
+            #only the potential at the first point is needed, so stop reading there
+            for line in f:
+                if not line.startswith(('#','@')):
+                    V0 = float(line.split()[1])
+                    break
+        maxV = -(V0-EF)*HA_TO_EV
     else:
         maxV = 0
 
-    ef     = 0.
-    l_labels = 999
-    l_label  = 999
-    x_labels = []
-
-    with open(file2) as fb:
-        # Initiate variables
-        header = fb.readline()
-        N = int(header.split()[2])
-        M = int(header.split()[4])
-        E     = np.zeros(N)
-        Ebeta = np.zeros(N)
-        BANDS = np.zeros((N,M))
-        BANDSbeta = np.zeros((N,M))
-        i = 0
-        ib = 0
-        alpha_beta_counter = 0
-        #This "if" is to correct crystal formatting when you have over 1000 elements per line
-        if M > 1000:
-            for l,line in enumerate(fb):
-                if line.startswith("@ XAXIS TICK SPEC"): # Get the x-axis ticks
-                    n_labels = int(line.split()[-1])
-                    l_label  = l
-                    l_labels = l+1
-                if l == l_labels:
-                    x_labels.append(float(line.split()[-1]))
-                    l_labels +=2
-                    if l_labels > l_label+2*n_labels-1:
-                        l_labels=1e30
-                if line.startswith("# EFERMI (HARTREE)"): # fermi energy
-                    ef = float(line.split()[-1])*27.2114
-                    alpha_beta_counter =+ 1
-                if line.startswith("#") or line.startswith("@"):
-                    continue
-                if alpha_beta_counter == 0: # This is to get alpha electron bands
-                    data = line.split()
-                    while len(data) != M+1:
-                        data = np.concatenate([data,next(fb).split()])
-                    E[i] = float(data[0])
-                    for j in range(0,M):
-                        BANDS[i,j] = (float(data[j+1])*27.2114)+maxV
-                    i = i+1
-                if alpha_beta_counter == 1: # This is to get beta electron bands
-                    data = line.split()
-                    while len(data) != M+1:
-                        data = np.concatenate([data,next(fb).split()])
-                    Ebeta[ib] = float(data[0])
-                    for j in range(0,M):
-                        BANDSbeta[ib,j] = (float(data[j+1])*27.2114)+maxV
-                    ib = ib+1
-                if alpha_beta_counter == 2:
-                    break
-        # Same logic repeats, but this time we don't have to worry about formatting
-        else:
-            for l,line in enumerate(fb):
-                if line.startswith("@ XAXIS TICK SPEC"):
-                    n_labels = int(line.split()[-1])
-                    l_label  = l
-                    l_labels = l+1
-                if l == l_labels:
-                    x_labels.append(float(line.split()[-1]))
-                    l_labels +=2
-                    if l_labels > l_label+2*n_labels-1:
-                        l_labels=1e30
-                if line.startswith("# EFERMI (HARTREE)"):
-                    ef = float(line.split()[-1])*27.2114
-                    alpha_beta_counter =+ 1
-                if line.startswith("#") or line.startswith("@"):
-                    continue
-                if alpha_beta_counter == 0:
-                    data = line.split()
-                    E[i] = float(data[0])
-                    for j in range(0,M):
-                        BANDS[i,j] = (float(data[j+1])*27.2114)+maxV
-                    i = i+1
-                if alpha_beta_counter == 1:
-                    data = line.split()
-                    Ebeta[ib] = float(data[0])
-                    for j in range(0,M):
-                        BANDSbeta[ib,j] = (float(data[j+1])*27.2114)+maxV
-                    ib = ib+1
-                if alpha_beta_counter == 2:
-                    break
+    E, BANDS, Ebeta, BANDSbeta, x_labels, ef = band_data(material, file2, maxV)
     # Set the x-axis labels (depends on how you set up the d3)
     labels = ['G','M','K','G']
     #labels = ['G','X','U|K','G','L','W','X']
@@ -143,13 +150,13 @@ def ipBANDS(material,E_l,E_u):
     # else:
     #     labels = ["G","X|Y","G","Z|R$_2$","G","T$_2$|U$_2$","G","V$_2$|$\Gamma$","X'|Y'","G","Z'|R$_2$'","G","T$_2$'|U$_2$'","G","V$_2$'"]
 
-    # Replaces "G" with latex style gamma in the x-labels
-    for i in range(0,len(labels)):
-        if labels[i] == 'G':
-            labels[i] = r"$\Gamma$"
+    # Replaces "G" with latex style gamma in the x-labels, also on either side of a "|"
+    labels = ['|'.join(r"$\Gamma$" if p == 'G' else p for p in x.split('|')) for x in labels]
 
-    #Make figure (you can change fig size if necessary)
-    fig = plt.figure(figsize=(5,5), dpi=100)
+    #Make figure (you can change fig size if necessary); a bare Figure on an Agg canvas
+    #is not registered with pyplot, so nothing has to be closed after saving it
+    fig = Figure(figsize=(5,5), dpi=100)
+    FigureCanvasAgg(fig)
     ax  = fig.add_subplot(111)
 
     #Uncomment next two lines if you want title
@@ -158,11 +165,11 @@ def ipBANDS(material,E_l,E_u):
 
     #Limits, plot bands, plot E_F, and plot path labels
     ax.set(ylim=(E_l+maxV,E_u+maxV),xlim=(x_labels[0],x_labels[-1]))
-    ax.plot(E,BANDS,linewidth=1.8,color="#f9665e")
-    ax.plot(Ebeta,BANDSbeta,linewidth=1.8,linestyle='--',color="#45b6fe")
-    plt.axhline(maxV,color="black",linestyle='--',lw =1.5,alpha=1)
+    ax.add_collection(band_lines(E,BANDS,linewidth=1.8,color="#f9665e"))
+    ax.add_collection(band_lines(Ebeta,BANDSbeta,linewidth=1.8,linestyle='--',color="#45b6fe"))
+    ax.axhline(maxV,color="black",linestyle='--',lw =1.5,alpha=1)
     for label in x_labels:
-        plt.axvline(label, color ="black",lw =1,alpha=0.5)
+        ax.axvline(label, color ="black",lw =1,alpha=0.5)
 
     #If there is a POTC file, change y label to "wrt vacuum"
     if exists(file4):
@@ -171,12 +178,13 @@ def ipBANDS(material,E_l,E_u):
         ax.set_ylabel(r"$E-E_f$ (eV)",size=20)
 
     #ticks
-    plt.xticks(x_labels[0:len(labels)],labels,size=14)
-    plt.yticks(size=18)
+    ax.set_xticks(x_labels[0:len(labels)])
+    ax.set_xticklabels(labels,size=14)
+    ax.tick_params(axis='y',labelsize=18)
 
     #These are here just for the labels
-    plt.axvline(x_labels[0]-100,linewidth=1.8,color="#f9665e",label='Spin up')
-    plt.axvline(x_labels[0]-100,linewidth=1.8,linestyle='--',color="#45b6fe",label='Spin down')
+    ax.axvline(x_labels[0]-100,linewidth=1.8,color="#f9665e",label='Spin up')
+    ax.axvline(x_labels[0]-100,linewidth=1.8,linestyle='--',color="#45b6fe",label='Spin down')
 
     # These lines set the position of the "spin up" and "spin down" legend (outside of the plot)
     # they make the plot 20% smaller in the x direction to make space for the legend
@@ -184,15 +192,12 @@ def ipBANDS(material,E_l,E_u):
     ax.set_position([box.x0, box.y0, box.width * 0.8, box.height])
     ax.legend(loc='center left', bbox_to_anchor=(1, 0.75))
 
-    # tight layout so everything shows correctly and plot
+    # tight layout so everything shows correctly
     fig.tight_layout()
-    plt.tight_layout()
-    plt.show()
 
     # Save figure as png and svg
     fig.savefig(FIGDIR + material+'.BANDS.svg', format='svg', dpi=300)
     fig.savefig(FIGDIR + material+'.BANDS.png', format='png', dpi=300)
-    plt.close('all')
 
 #Define directories where files are, and where figures will be saved
 DIR = (os.getcwd()+'/')
@@ -204,10 +209,18 @@ pathlist = glob.glob(DIR+'*_BAND.BAND.dat')
 nDIR = len(DIR)
 ntype = len("_BAND.BAND.dat")
 
-# Loops over all BANDS.d3 files in a folder
-for path in pathlist:
-    path_in_str = str(path)
-    material = path_in_str[nDIR:-ntype]
-    if material == "":break
-    print(material)
-    ipBANDS(material,E_l,E_u)
+if __name__ == "__main__":
+    # Loops over all BANDS.d3 files in a folder
+    materials = []
+    for path in pathlist:
+        path_in_str = str(path)
+        material = path_in_str[nDIR:-ntype]
+        if material == "":break
+        print(material)
+        materials.append(material)
+
+    # materials are independent, so they are plotted in parallel
+    with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        futures = [ex.submit(ipBANDS, material, E_l, E_u) for material in materials]
+        for future in futures:
+            future.result()
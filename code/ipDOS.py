@@ -14,53 +14,64 @@ After this, the program will prompt you to plot any projections
 #LOAD EVERYTHING
 import sys
 import numpy as np
+import matplotlib
+matplotlib.use('Agg') # headless, so the materials can be plotted in worker processes
 import matplotlib.pyplot as plt
 import os
-import glob
+import concurrent.futures
+import re
+import mmap
 from os.path import exists
 
+#Keep SVG text as <text> instead of converting every glyph to a path
+plt.rcParams['svg.fonttype'] = 'none'
+
+HA_TO_EV = 27.2114
+
+#comment, xmgrace and set separator lines of a .DOSS.dat; everything else is numbers
+META_RE = re.compile(rb'^[#@&].*\n?', re.M)
+
+#DOSS keyword of a .d3 file, with the number of projections from the line after it
+DOSS_RE = re.compile(r'^DOSS.*\n[ \t]*(\d+)[^\n]*\n', re.M)
+
+#Label rewrites for the projections of the .d3, applied with a single regex pass
+LABEL_SUBS = {' all': '_all', ' S': '_s', ' P': '_p', ' D': '_d', ' F': '_f', 'END': 'Total DOS'}
+LABEL_RE = re.compile('|'.join(map(re.escape, LABEL_SUBS)))
+
 #Read the user input
 E_l = float(sys.argv[1])
 E_u = float(sys.argv[2])
 
-def ipDOS(material,E_l,E_u):
-    file  = material+'_DOSS.DOSS.dat'
+#Returns the plot labels of a material: the energy followed by the projections in its .d3 file
+def dos_labels(material):
     file1 = material+'_DOSS.d3'
-    file4 = material+'_POTC.POTC.dat'
-    file5 = material+'_POTC.out'
 
     #We define necessary lists and variables
-    v=[]; labels=['Energy (eV)']; n=9999; num=9999;
+    v=[]; labels=['Energy (eV)']
 
-    #Grabs the labels from the .d3 file and puts them in a list to be used by the rest of our code
+    #Grabs the labels from the .d3 file and puts them in a list to be used by the rest of our code:
+    #the projection lines that follow DOSS and its line with the number of projections, up to END
     with open(file1) as F:
-        for i,line in enumerate(F):
-            if line.startswith('DOSS'):
-                n=i
-            if i == n+1:
-                l = line.split()
-                num = int(l[0])
-            if i>=n+2 and i<=n+2+num:
-                v.append(str(line[max(line.find('#'),0):].strip()))
+        d3 = F.read()
+    m = DOSS_RE.search(d3)
+    if m:
+        for line in d3[m.end():].splitlines()[:int(m.group(1))+1]:
+            v.append(str(line[max(line.find('#'),0):].strip()))
             if line.startswith('END'):
                 break
 
-    #We change some of the label characters for formatting purposes
+    #We change some of the label characters for formatting purposes (all the LABEL_SUBS in one pass)
     for i in v:
-        j = i.replace(' all','_all')
-        j = j.replace(' S','_s')
-        j = j.replace(' P','_p')
-        j = j.replace(' D','_d')
-        j = j.replace(' F','_f')
-        j = j.replace('END','Total DOS')
-        l = j.replace('#','')
+        l = LABEL_RE.sub(lambda m: LABEL_SUBS[m.group()], i).replace('#','')
         if l[0].isupper() and l[1].isupper():
             j = list(l)
             j[1]=j[1].lower()
             l = ''.join(j)
         labels.append(l)
+    return labels
 
-    # User input for projections
+#Asks the user which of the available projections to plot
+def ask_projections(labels):
     search = []
     print('Available projections:')
     print(labels[1:len(labels)-1])
@@ -69,78 +80,70 @@ def ipDOS(material,E_l,E_u):
     for i in range(int(num)):
         n = input("Projection "+str(i+1)+': ')
         search.append(str(n))
+    return search
+
+#Plots the DOS of one material into figdir; labels and search come from dos_labels and ask_projections
+def ipDOS(material,E_l,E_u,labels,search,figdir):
+    file  = material+'_DOSS.DOSS.dat'
+    file4 = material+'_POTC.POTC.dat'
+    file5 = material+'_POTC.out'
 
     #If POTC file exists, open file and look for electrostatic potential at inf and Efermi
     if exists(file4) and exists(file5):
-        z = []; V  = [];
         EF = 0
-        with open(file5) as f5:
-            for i,line in enumerate(f5):
-                if 'FERMI ENERGY' in line:
-                    EF = float(line.split()[-1])
+        #only the last FERMI ENERGY line counts, so it is searched for from the end of the file
+        #(an empty file, e.g. of a POTC job that has not run, cannot be mapped and keeps EF at 0)
+        if os.path.getsize(file5):
+            with open(file5,'rb') as f5, mmap.mmap(f5.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                i = mm.rfind(b'FERMI ENERGY')
+                if i >= 0:
+                    eol = mm.find(b'\n', i)
+                    EF = float(mm[i:eol if eol >= 0 else len(mm)].split()[-1])
         with open(file4) as f:
-            for i,line in enumerate(f):
-                if line.startswith('#') or line.startswith('@'):
-                    continue
-                else:
-                    z.append(float(line.split()[0]))
-                    V.append(float(line.split()[1]))
-        maxV = -(V[0]-EF)*27.2114
+            #only the potential at the first point is needed, so stop reading there
+            for line in f:
+                if not line.startswith(('#','@')):
+                    V0 = float(line.split()[1])
+                    break
+        maxV = -(V0-EF)*HA_TO_EV
     else:
         maxV = 0
 
-    #Defines an empty data vector to put our data inside it. Also defines an empty variable for the fermi energy value
-    data_vect=[[] for n in range(len(labels))]; ef=0;
-
-    #Loops through the data and puts it in data_vect for plotting, also finds the fermi energy and puts it in ef
-    #with open(new_file) as f:
-    with open(file) as f:
-        if len(labels) >= 17:
-            for i,line in enumerate(f):
-                if line.startswith("# EFERMI (HARTREE)"):
-                    ef = float(line.split()[-1])*27.2114
-                if line.startswith("#") or line.startswith("@"):
-                    continue
-                if line.startswith("&"):
-                    continue#break
-                data = line.split()
-                ne = next(f)
-                ne = ne.split()
-                if len(data) >= 17 and len(ne) < 17:
-                    data = np.concatenate([data,ne])
-                data_vect[0].append(float(data[0])*27.2114+maxV)
-                for j in range(1,len(labels)):
-                    data_vect[j].append(float(data[j]))
-        else:
-            for i,line in enumerate(f):
-                if line.startswith("# EFERMI (HARTREE)"):
-                    ef = float(line.split()[-1])*27.2114
-                if line.startswith("#") or line.startswith("@"):
-                    continue
-                if line.startswith("&"):
-                    continue#break
-                data = line.split()
-                data_vect[0].append(float(data[0])*27.2114+maxV)
-                for j in range(1,len(labels)):
-                    data_vect[j].append(float(data[j]))
-
-    #Grab data only in the range we want to plot
-    plot_vect = [[] for n in range(len(labels))]
-    for i in range(1,len(plot_vect)):
-        for j in range(0,len(data_vect[0])):
-            if data_vect[0][j] >= E_l+maxV and data_vect[0][j] <= E_u+maxV:
-                plot_vect[i].append(data_vect[i][j])
-
-    for j in range(0,len(data_vect[0])):
-        if data_vect[0][j] >= E_l+maxV and data_vect[0][j] <= E_u+maxV:
-            plot_vect[0].append(data_vect[0][j])
+    #Defines an empty variable for the fermi energy value
+    ef=0
+
+    #Maps the data file and only visits the #/@/& lines one by one (finding the fermi energy and putting it in ef);
+    #the numbers between them are parsed in one go. Rows wrapped over two lines are absorbed by the reshape
+    chunks = []
+    with open(file,'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        for match in META_RE.finditer(mm):
+            chunks.append(mm[start:match.start()])
+            start = match.end()
+            if match.group().startswith(b"# EFERMI (HARTREE)"):
+                ef = float(match.group().split()[-1])*HA_TO_EV
+        chunks.append(mm[start:])
+    data = np.fromstring(b"".join(chunks), dtype=np.float64, sep=" ").reshape(-1, len(labels))
+    #energies in eV; data_vect holds one contiguous row per column of the file (energy, projections, total) for plotting
+    data[:,0] *= HA_TO_EV
+    data[:,0] += maxV
+    data_vect = np.ascontiguousarray(data.T)
+
+    #Grab data only in the range we want to plot, for all the projections at once
+    #(a single set has sorted energies, so the window is a slice found by bisection; alpha+beta sets need the mask)
+    E = data[:,0]
+    if np.all(E[1:] >= E[:-1]):
+        lo, hi = np.searchsorted(E, E_l+maxV, 'left'), np.searchsorted(E, E_u+maxV, 'right')
+        plot_vect = data_vect[:,lo:hi]
+    else:
+        plot_vect = data_vect[:,(E >= E_l+maxV) & (E <= E_u+maxV)]
 
     #Different color pallets
     color_pal = ['#ff0000','#000080','#006400','#8b4513','#00ced1','#ffa500','#2f4f4f','#ffff00','#00ff00','#0000ff','#d8bfd8','#ff00ff','#1e90ff','#ff1493','#98fb98']
     color_spinel = ['slategrey','peru','red'] #Zn, Fe, O
 
-    #Define figure and axes
-    fig = plt.figure(figsize=(4.5,8),dpi=100)
+    #Define figure and axes (constrained layout makes room for the legend outside the axes when drawing)
+    fig = plt.figure(figsize=(4.5,8),dpi=100,constrained_layout=True)
     ax  = fig.add_subplot(111)
 
     #Title, xlabel and ylabel
@@ -168,33 +171,24 @@ def ipDOS(material,E_l,E_u):
             ax.fill_betweenx(data_vect[0],data_vect[i],label=labels[i],alpha=0.8,color='gainsboro')
             ax.plot(data_vect[i],data_vect[0],color='gainsboro',linewidth=1.5)
 
-    for n in range(len(search)):
-        for i in range(1,len(data_vect)):
-            if (labels[i].find(search[n]) == -1):
-                continue
-            else:
-                #ax.fill_betweenx(data_vect[0],data_vect[i],label=labels[i], alpha=0.8)
-                ax.plot(data_vect[i],data_vect[0],label=labels[i],linewidth=1.35,alpha=0.7)
+    #columns of every projection whose label contains one of the search strings, in the order asked for
+    picked = [i for proj in search for i in range(1,len(labels)) if proj in labels[i]]
+    for i in picked:
+        #ax.fill_betweenx(data_vect[0],data_vect[i],label=labels[i], alpha=0.8)
+        ax.plot(data_vect[i],data_vect[0],label=labels[i],linewidth=1.35,alpha=0.7)
 
     plt.axhline(maxV,color="black",linestyle='--',lw =1.5,alpha=1)
     plt.axvline(0,color='black',lw=1.5)
 
     #Legend specs
-    box = ax.get_position()
-    ax.set_position([box.x0, box.y0, box.width * 0.8, box.height])
     legend=ax.legend(loc='center left', bbox_to_anchor=(1, 0.25))
     #legend.get_frame().set_facecolor('White')
     #legend.get_frame().set_edgecolor('None')
 
-    #tight layout & show the plot
-    fig.tight_layout()
-    plt.tight_layout()
-    plt.show()
-    plt.close('all')
-
     #Save the plot
-    fig.savefig(FIGDIR + material+'.DOSS.svg', format='svg', dpi=300)
-    fig.savefig(FIGDIR + material+'.DOSS.png', format='png', dpi=300)
+    fig.savefig(figdir + material+'.DOSS.svg', format='svg', dpi=300)
+    fig.savefig(figdir + material+'.DOSS.png', format='png', dpi=300)
+    plt.close('all')
 
 
 #This is the directory where the files will be saved. Make sure to change this accordingly.
@@ -202,13 +196,22 @@ DIR = (os.getcwd()+'/')
 FIGDIR = DIR
 #FIGDIR = "/home/daniel/Dropbox/Papers/2020_2D_Genome/Successful-Calculations/Chalcogenides-Danny/DOSS/figures/"
 #Necessary variables to execute the for loop
-pathlist = glob.glob(DIR+'*_DOSS.DOSS.dat')
-nDIR = len(DIR)
+#(a single scandir pass with a suffix test; the names come without the directory)
 ntype = len("_DOSS.DOSS.dat")
-
-for path in pathlist:
-    path_in_str = str(path)
-    material = path_in_str[nDIR:-ntype]
-    if material == "":break
-    print(material)
-    ipDOS(material,E_l,E_u)
+with os.scandir(DIR) as entries:
+    materials = sorted(e.name[:-ntype] for e in entries if e.name.endswith("_DOSS.DOSS.dat"))
+
+if __name__ == "__main__":
+    #The projections are asked for every material first, since the workers cannot prompt
+    jobs = []
+    for material in materials:
+        if material == "":break
+        print(material)
+        labels = dos_labels(material)
+        jobs.append((material, labels, ask_projections(labels)))
+
+    #materials are independent, so they are plotted in parallel
+    with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        futures = [ex.submit(ipDOS, material, E_l, E_u, labels, search, FIGDIR) for material, labels, search in jobs]
+        for future in futures:
+            future.result()
@@ -111,11 +111,12 @@ for path in pathlist:
                 y = np.zeros(num_atoms)
                 z = np.zeros(num_atoms)
             if counter <= i and i <= counter+num_atoms-1:
-                el[i-counter] = int(line.split()[0])
+                vals = line.split()
+                el[i-counter] = int(vals[0])
                 #if el[i-counter] >200:el[i-counter]-=200 #check if this is needed
-                x[i-counter] = float(line.split()[1])
-                y[i-counter] = float(line.split()[2])
-                z[i-counter] = float(line.split()[3])
+                x[i-counter] = float(vals[1])
+                y[i-counter] = float(vals[2])
+                z[i-counter] = float(vals[3])
             lines_in_d12.append(line)
     f.close()
     idx = min(end_index) # "idx" tracks the line where the first "END" was
@@ -7,13 +7,33 @@ import re
 import linecache
 import shutil
 import itertools
+import subprocess
+import concurrent.futures
 
 """Change the data_folder depending on where your files are"""
 data_folder = r'/mnt/home/djokicma/Crystal17/IRCOF102/OPT/SimpleDZ' 
-data_files = os.listdir(data_folder)
+submit_script = "/mnt/home/djokicma/Crystal17/IRCOF102/OPT/SimpleDZ/submitcrystal17.sh"
+#How many submissions run at once; kept small so the jobs do not hit sbatch all at the same time
+max_submits = 16
+
+"""Submits one job through bash (the script has no #! line); returns the name if it failed"""
+def submit(submit_name):
+  try:
+    subprocess.run(["bash", submit_script, submit_name, "100"], check=True)
+  except subprocess.CalledProcessError as err:
+    print(submit_name + " failed to submit (exit status " + str(err.returncode) + ")")
+    return submit_name
+  except OSError as err:
+    print(submit_name + " failed to submit (" + str(err) + ")")
+    return submit_name
+  return None
 
 """Reads each file given by data_folder and loops through to find the average bond length"""
-for file_name in data_files:
-  if ".d12" in file_name:
-    submit_name = file_name.split(".d12")[0]
-    os.system("/mnt/home/djokicma/Crystal17/IRCOF102/OPT/SimpleDZ/submitcrystal17.sh " + submit_name + " 100")
+if __name__ == "__main__":
+  with os.scandir(data_folder) as entries:
+    submit_names = [e.name[:-len(".d12")] for e in entries if e.name.endswith(".d12")]
+  #submitcrystal17.sh only writes and queues a job script, so several can run at once
+  with concurrent.futures.ThreadPoolExecutor(max_workers=max_submits) as ex:
+    failed = [name for name in ex.map(submit, submit_names) if name is not None]
+  if failed:
+    print(str(len(failed)) + " submissions failed: " + " ".join(failed))
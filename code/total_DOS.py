@@ -12,11 +12,38 @@ python total_DOS.py -5 5
 #LOAD EVERYTHING
 import sys
 import numpy as np
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import os
-import glob
+import concurrent.futures
+import re
+import mmap
 from os.path import exists
-import csv
+
+HA_TO_EV = 27.2114
+
+#comment, xmgrace and set separator lines of a .DOSS.dat; everything else is numbers
+META_RE = re.compile(rb'^[#@&].*\n?', re.M)
+
+#DOSS keyword of a .d3 file, with the number of projections from the line after it
+DOSS_RE = re.compile(r'^DOSS.*\n[ \t]*(\d+)[^\n]*\n', re.M)
+
+#Label rewrites for the projections of the .d3 (dropping the '#'), applied with a single regex pass
+LABEL_SUBS = {' all': '  ', ' S': '_s', ' P': '_p', ' D': '_d', ' F': '_f', 'END': 'Total DOS', '#': ''}
+LABEL_RE = re.compile('|'.join(map(re.escape, LABEL_SUBS)))
+#Two capitals at the start of a label; the second one gets lowercased
+CAPS_RE = re.compile(r'^([A-Z])([A-Z])', re.M)
+
+#Tells the kernel the file is read once front to back so it reads ahead
+def advise_sequential(f):
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+#One figure for all the materials: a bare Figure on an Agg canvas is not registered with pyplot
+#(so no GUI toolkit is loaded and nothing piles up), and its axes are cleared before each material
+FIG = Figure(figsize=(4,5))
+FigureCanvasAgg(FIG)
+AX = FIG.add_subplot(111)
 
 #Read the user input
 E_l = float(sys.argv[1])
@@ -29,124 +56,93 @@ def ipDOS(material,E_l,E_u):
     file5 = material+'_ghosts_POTC.out'
 
     #We define necessary lists and variables
-    v=[]; labels=['Energy (eV)']; n=9999; num=9999; 
+    v=[]; labels=['Energy (eV)']
 
-    #Grabs the labels from the .d3 file and puts them in a list to be used by the rest of our code
+    #Grabs the labels from the .d3 file and puts them in a list to be used by the rest of our code:
+    #the projection lines that follow DOSS and its line with the number of projections, up to END
     with open(file1) as F:
-        for i,line in enumerate(F):
-            if line.startswith('DOSS'):
-                n=i
-            if i == n+1:
-                l = line.split()
-                num = int(l[0])
-            if i>=n+2 and i<=n+2+num:
-                v.append(str(line[max(line.find('#'),0):].strip()))
+        advise_sequential(F)
+        d3 = F.read()
+    m = DOSS_RE.search(d3)
+    if m:
+        for line in d3[m.end():].splitlines()[:int(m.group(1))+1]:
+            v.append(str(line[max(line.find('#'),0):].strip()))
             if line.startswith('END'):
                 break
 
     #We change some of the label characters for formatting purposes
-    for i in v:
-        j = i.replace(' all','  ')
-        j = j.replace(' S','_s')
-        j = j.replace(' P','_p')
-        j = j.replace(' D','_d')
-        j = j.replace(' F','_f')
-        j = j.replace('END','Total DOS')
-        l = j.replace('#','')
-        if len(l)>1 and l[0].isupper() and l[1].isupper():
-            j = list(l)
-            j[1]=j[1].lower()
-            l = ''.join(j)
-        labels.append(l)
+    #(the labels are joined so LABEL_RE and CAPS_RE each make one pass over all of them)
+    if v:
+        blob = LABEL_RE.sub(lambda m: LABEL_SUBS[m.group()], '\n'.join(v))
+        labels += CAPS_RE.sub(lambda m: m.group(1)+m.group(2).lower(), blob).split('\n')
 
     # User input for projections
     search = []
 
     #If POTC file exists, open file and look for electrostatic potential at inf and Efermi
     if exists(file4) and exists(file5):
-        z = []; V  = []; 
         EF = 0
-        with open(file5) as f5:
-            for i,line in enumerate(f5):
-                if 'FERMI ENERGY' in line:
-                    EF = float(line.split()[-1])
+        #only the last FERMI ENERGY line counts, so it is searched for from the end of the file
+        #(an empty file, e.g. of a POTC job that has not run, cannot be mapped and keeps EF at 0)
+        if os.path.getsize(file5):
+            with open(file5,'rb') as f5, mmap.mmap(f5.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                i = mm.rfind(b'FERMI ENERGY')
+                if i >= 0:
+                    eol = mm.find(b'\n', i)
+                    EF = float(mm[i:eol if eol >= 0 else len(mm)].split()[-1])
         with open(file4) as f:
-            for i,line in enumerate(f):
-                if line.startswith('#') or line.startswith('@'):
-                    continue
-                else:
-                    z.append(float(line.split()[0]))
-                    V.append(float(line.split()[1]))
-        maxV = -(V[0]-EF)*27.2114
+            #only the potential at the first point is needed, so stop reading there
+            for line in f:
+                if not line.startswith(('#','@')):
+                    V0 = float(line.split()[1])
+                    break
+        maxV = -(V0-EF)*HA_TO_EV
     else:
         maxV = 0
 
-    #Defines an empty data vector to put our data inside it. Also defines an empty variable for the fermi energy value
-    data_vect=[[] for n in range(len(labels))]
+    #Defines an empty variable for the fermi energy value
     ef=0
 
-    #Loops through the data and puts it in data_vect for plotting, also finds the fermi energy and puts it in ef
-    #with open(new_file) as f:
-    with open(file) as f:
-        if len(labels) >= 17:
-            for i,line in enumerate(f):
-                if line.startswith("# EFERMI (HARTREE)"):
-                    ef = float(line.split()[-1])*27.2114
-                if line.startswith("#") or line.startswith("@"):
-                    continue
-                if line.startswith("&"):
-                    continue#break
-                data = line.split()
-                ne = next(f)
-                ne = ne.split()
-                if len(data) >= 17 and len(ne) < 17:
-                    data = np.concatenate([data,ne])
-                data_vect[0].append(float(data[0])*27.2114+maxV)
-                for j in range(1,len(labels)):
-                    data_vect[j].append(float(data[j]))
-        else:
-            for i,line in enumerate(f):
-                if line.startswith("# EFERMI (HARTREE)"):
-                    ef = float(line.split()[-1])*27.2114
-                if line.startswith("#") or line.startswith("@"):
-                    continue
-                if line.startswith("&"):
-                    continue#break
-                data = line.split()
-                data_vect[0].append(float(data[0])*27.2114+maxV)
-                for j in range(1,len(labels)):
-                    data_vect[j].append(float(data[j]))
-
-    #Grab data only in the range we want to plot
-    plot_vect = [[] for n in range(len(labels))]
-    for i in range(1,len(plot_vect)):
-        for j in range(0,len(data_vect[0])):
-            if data_vect[0][j] >= E_l+maxV and data_vect[0][j] <= E_u+maxV:
-                plot_vect[i].append(data_vect[i][j])
-
-    for j in range(0,len(data_vect[0])):
-        if data_vect[0][j] >= E_l+maxV and data_vect[0][j] <= E_u+maxV:
-            plot_vect[0].append(data_vect[0][j])
+    #Maps the data file and only visits the #/@/& lines one by one (finding the fermi energy and putting it in ef);
+    #the numbers between them are parsed in one go. Rows wrapped over two lines are absorbed by the reshape
+    chunks = []
+    with open(file,'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        advise_sequential(f)
+        start = 0
+        for match in META_RE.finditer(mm):
+            chunks.append(mm[start:match.start()])
+            start = match.end()
+            if match.group().startswith(b"# EFERMI (HARTREE)"):
+                ef = float(match.group().split()[-1])*HA_TO_EV
+        chunks.append(mm[start:])
+    data = np.fromstring(b"".join(chunks), dtype=np.float64, sep=" ").reshape(-1, len(labels))
+    #energies in eV
+    data[:,0] *= HA_TO_EV
+    data[:,0] += maxV
+
+    #Grab data only in the range we want to plot, for all the projections at once
+    #(a single set has sorted energies, so the window is a slice found by bisection; alpha+beta sets need the mask)
+    E = data[:,0]
+    if np.all(E[1:] >= E[:-1]):
+        lo, hi = np.searchsorted(E, E_l+maxV, 'left'), np.searchsorted(E, E_u+maxV, 'right')
+        plot_vect = data[lo:hi]
+    else:
+        plot_vect = data[(E >= E_l+maxV) & (E <= E_u+maxV)]
     
-    E = []
-    DOS = []
-    for i in range(len(plot_vect[0])):
-        E.append(plot_vect[0][i])
-        DOS.append(plot_vect[-1][i])
+    #the alpha set is followed by the beta set
+    E = plot_vect[:,0]
+    DOS = plot_vect[:,-1]
     E_a = E[:int(len(E)/2)]
     #E_b = E[int(len(E)/2):]
     DOS_a = DOS[:int(len(E)/2)]
     DOS_b = DOS[int(len(E)/2):]
-    total_DOS = [abs(DOS_a[i])+np.abs(DOS_b[i]) for i in range(len(DOS_a))]
-    with open('DOS_'+material+'.csv', 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['Energy (eV)','Total DOS (a.u.)'])
-        for i in range(len(E_a)):
-            writer.writerow([E_a[i],total_DOS[i]])
+    total_DOS = np.abs(DOS_a)+np.abs(DOS_b[:len(DOS_a)])
+    np.savetxt('DOS_'+material+'.csv', np.column_stack((E_a,total_DOS)), fmt='%s', delimiter=',',
+               header='Energy (eV),Total DOS (a.u.)', comments='')
    
-    #Define figure and axes
-    fig = plt.figure(figsize=(4,5))
-    ax  = fig.add_subplot(111)
+    #Define figure and axes (reused, after clearing the previous material)
+    fig, ax = FIG, AX
+    ax.clear()
 
     #Title, xlabel and ylabel
     ax.set_xlabel("DOS",size=18)
@@ -159,17 +155,16 @@ def ipDOS(material,E_l,E_u):
     xlimit = np.max(np.max(total_DOS))
     ax.set(xlim=(0,xlimit),ylim=(E_l+maxV,E_u+maxV))
     ax.set_xticks([])
-    plt.yticks(size=18)
+    ax.tick_params(axis='y',labelsize=18)
 
     #plot
     ax.fill_betweenx(E_a,total_DOS,color='darkgrey')
     ax.plot(total_DOS,E_a,color='black',alpha=0.3,linewidth=1)
-    plt.axhline(maxV,color="black",linestyle='--',lw =1.5,alpha=1)
-    plt.axvline(0,color='black',lw=1.5)
+    ax.axhline(maxV,color="black",linestyle='--',lw =1.5,alpha=1)
+    ax.axvline(0,color='black',lw=1.5)
 
     #tight layout & show the plot
     fig.tight_layout()
-    plt.tight_layout()
     #plt.show()
 
     #Save the plot
@@ -180,13 +175,15 @@ def ipDOS(material,E_l,E_u):
 DIR = (os.getcwd()+'/')
 FIGDIR = DIR
 #Necessary variables to execute the for loop
-pathlist = glob.glob(DIR+'*_DOSS.DOSS.dat')
-nDIR = len(DIR)
+#(a single scandir pass with a suffix test; a bare "_DOSS.DOSS.dat" has no material and is skipped)
 ntype = len("_DOSS.DOSS.dat")
-
-for path in pathlist:
-    path_in_str = str(path)
-    material = path_in_str[nDIR:-ntype]
-    if material == "":break
-    print(material)
-    ipDOS(material,E_l,E_u)
+with os.scandir(DIR) as entries:
+    materials = sorted(e.name[:-ntype] for e in entries if e.name.endswith("_DOSS.DOSS.dat") and len(e.name) > ntype)
+
+if __name__ == "__main__":
+    #materials are independent (each one writes its own CSV and PNG), so they are plotted in parallel
+    with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        futures = [ex.submit(ipDOS, material, E_l, E_u) for material in materials]
+        for material, future in zip(materials, futures):
+            future.result()
+            print(material)